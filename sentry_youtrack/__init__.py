@@ -1 +1,3 @@
 VERSION = '0.3.5'
+
+default_app_config = 'sentry_youtrack.apps.YouTrackConfig'
@@ -0,0 +1,393 @@
+"""
+Asyncio variant of `YouTrackClient` built on top of aiohttp.
+
+Requires Python 3.6+ and the ``async`` extra (``pip install
+sentry-youtrack[async]``). Django views keep using the blocking
+`YouTrackClient`; `SyncYouTrackClient` is a thin facade which runs the
+asyncio client on its own event loop.
+
+Errors are raised as the `requests` exceptions raised by `YouTrackClient`
+(`HTTPError` with the response, `ConnectionError`, `SSLError`), so both
+clients can be used with the same error handling.
+
+Pass the instance's `RequestScheduler` as `limiter`, e.g.
+``limiter=get_registry().get_scheduler(url)``, so the requests share the
+concurrency and rate limits (and the priority ordering) of the blocking
+clients. The priority set with `scheduler.priority` is shared by all tasks
+of an event loop, so background jobs rather create their client with
+``priority=BACKGROUND``.
+"""
+import asyncio
+import inspect
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+import requests
+
+from .conf import youtrack_settings
+from .scheduler import get_priority
+from .youtrack import (
+    BaseYouTrackClient, YouTrackError, _bundle_names, _field_names)
+
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncYouTrackClient(BaseYouTrackClient):
+
+    def __init__(self, url, api_key=None, verify_ssl_certificate=True,
+                 session=None, limit=10, limiter=None, priority=None,
+                 max_retries=BaseYouTrackClient.MAX_RETRIES):
+        self.verify_ssl_certificate = verify_ssl_certificate
+        self.url = url.rstrip('/') if url else ''
+        self.session = session
+        self.limit = limit
+        self.limiter = limiter
+        self.priority = priority
+        self.max_retries = max_retries
+        self.executor = None
+        self.api_key = api_key
+        self.cookies = {}
+        if api_key is not None:
+            self.cookies = {self.API_KEY_COOKIE_NAME: api_key}
+
+    @classmethod
+    async def login(cls, url, username, password, **kwargs):
+        client = cls(url, **kwargs)
+        client.api_key = await client._login(username, password)
+        client.cookies = {client.API_KEY_COOKIE_NAME: client.api_key}
+        return client
+
+    async def _login(self, username, password):
+        credentials = {
+            'login': username,
+            'password': password}
+        url = self.url + self.LOGIN_URL
+        response, text = await self.request(
+            url, data=credentials, method='post', return_response=True)
+        if self._parse(text).login is None:
+            raise requests.HTTPError('Invalid YouTrack url')
+        cookie = response.cookies.get(self.API_KEY_COOKIE_NAME)
+        return cookie.value if cookie is not None else None
+
+    def _get_session(self):
+        if self.session is None:
+            kwargs = {'limit': self.limit}
+            if not self.verify_ssl_certificate:
+                kwargs['ssl'] = False
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(**kwargs))
+        return self.session
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+    async def _acquire(self):
+        """
+        Waits for the limiter in a worker thread, the scheduler is shared
+        with the blocking clients and waits on a thread condition.
+        """
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.limit)
+        priority_value = self.priority
+        if priority_value is None:
+            priority_value = get_priority()
+        acquired = self.executor.submit(self.limiter.acquire, priority_value)
+        try:
+            await asyncio.wrap_future(acquired)
+        except asyncio.CancelledError:
+            # the slot may still be taken after the caller has gone
+            def release(future):
+                if not future.cancelled() and future.exception() is None:
+                    self.limiter.release()
+            acquired.add_done_callback(release)
+            raise
+
+    async def _send(self, method, url, data, params):
+        session = self._get_session()
+        try:
+            async with session.request(
+                    method.upper(), url, data=data, params=params,
+                    cookies=self.cookies,
+                    headers={'User-Agent': self.user_agent}) as response:
+                return response, await response.text()
+        except aiohttp.ClientSSLError as e:
+            raise requests.exceptions.SSLError(e)
+        except aiohttp.ClientConnectionError as e:
+            raise requests.ConnectionError(e)
+
+    async def _wait_for_retry(self, response):
+        delay = self._get_retry_after(response)
+        logger.warning('YouTrack rate limit exceeded, retrying in %ss', delay)
+        if hasattr(self.limiter, 'pause'):
+            self.limiter.pause(delay)
+        else:
+            await asyncio.sleep(delay)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def request(self, url, data=None, params=None, method='get',
+                      return_response=False):
+        if method not in ['get', 'post']:
+            raise AttributeError("Invalid method %s" % method)
+
+        if params:
+            params = dict((key, str(value)) for key, value in params.items()
+                          if value is not None)
+        logger.debug('%s: %s' % (method, url))
+        for attempt in range(self.max_retries + 1):
+            if self.limiter is not None:
+                await self._acquire()
+                try:
+                    response, text = await self._send(
+                        method, url, data, params)
+                finally:
+                    self.limiter.release()
+            else:
+                response, text = await self._send(method, url, data, params)
+            if response.status != 429 or attempt == self.max_retries:
+                break
+            await self._wait_for_retry(response)
+        self._get_response(response, text).raise_for_status()
+        if return_response:
+            return response, text
+        return text
+
+    def _get_response(self, response, text):
+        """
+        Returns the aiohttp response as a `requests.Response`.
+        """
+        result = requests.Response()
+        result.status_code = response.status
+        result.reason = response.reason
+        result.url = str(response.url)
+        result.headers.update(response.headers)
+        result.encoding = 'utf-8'
+        result._content = text.encode('utf-8')
+        return result
+
+    async def _get_bundle(self, text, bundle='enumeration'):
+        soup = self._parse_bundle(text)
+        if bundle == 'userBundle':
+            return await self._get_userbundle_values(soup)
+        return [item.text for item in getattr(soup, bundle)]
+
+    async def _get_userbundle_values(self, soup):
+        users = set(self._get_user_logins(soup.userBundle))
+        groups = await asyncio.gather(*[
+            self._get_users_from_group(group['name'])
+            for group in soup.userBundle.findAll('userGroup')])
+        for group in groups:
+            users.update(self._get_user_logins(group))
+        return sorted(users)
+
+    async def _get_users_from_group(self, group):
+        url = self.url + self.USER_URL.replace('/<user>', '')
+        text = await self.request(url, method='get', params={'group': group})
+        return self._parse(text).userRefs
+
+    async def _get_custom_field_values(self, name, value,
+                                       bundle='enumeration'):
+        url = self._get_custom_field_values_url(name, value)
+        text = await self.request(url, method='get')
+        return await self._get_bundle(text, bundle)
+
+    async def _get_custom_project_field_details(self, field):
+        url = self._get_project_field_url(field)
+        field_data = self._parse(await self.request(url, method='get'))
+
+        values = None
+        kwargs = self._get_field_bundle_params(field_data)
+        if kwargs:
+            values = await self._get_custom_field_values(**kwargs)
+        return self._get_field_details(field_data, values)
+
+    async def get_project_name(self, project_id):
+        url = self.url + self.PROJECT_URL.replace('<project_id>', project_id)
+        text = await self.request(url, method='get')
+        return self._parse(text).project['name']
+
+    async def get_user(self, username):
+        url = self.url + self.USER_URL.replace('<user>', username)
+        text = await self.request(url, method='get')
+        return self._parse(text).user
+
+    async def get_projects(self):
+        url = self.url + self.PROJECTS_URL
+        return list(self._parse_projects(await self.request(url)))
+
+    async def get_field_bundle_name(self, field_name, project_id=None):
+        bundle_name = self._get_cached(_bundle_names, (project_id, field_name))
+        if bundle_name is None:
+            url = self._get_field_bundle_url(field_name, project_id)
+            text = await self.request(url, method='get')
+            bundle_name = self._parse_field_bundle_name(text)
+            self._set_cached(
+                _bundle_names, (project_id, field_name), bundle_name)
+        return bundle_name
+
+    async def find_field_bundle_name(self, names, project_id=None):
+        key = (project_id, tuple(names))
+        field_name = self._get_cached(_field_names, key)
+        if field_name is None:
+            if project_id:
+                fields = await self.get_project_fields_list(project_id)
+            else:
+                fields = await self.get_custom_fields_list()
+            field_name = self._match_field_name(names, fields)
+            self._set_cached(_field_names, key, field_name)
+        return await self.get_field_bundle_name(field_name, project_id)
+
+    async def get_priorities(self, project_id=None):
+        bundle_name = await self.find_field_bundle_name(
+            youtrack_settings.PRIORITY_FIELDS, project_id)
+        return await self._get_custom_field_values('bundle', bundle_name)
+
+    async def get_issue_types(self, project_id=None):
+        bundle_name = await self.find_field_bundle_name(
+            youtrack_settings.TYPE_FIELDS, project_id)
+        return await self._get_custom_field_values('bundle', bundle_name)
+
+    async def get_project_issues(self, project_id, query=None, offset=0,
+                                 limit=15):
+        url = self.url + self.ISSUES_URL.replace('<project_id>', project_id)
+        params = {'max': limit, 'after': offset, 'filter': query}
+        text = await self.request(url, method='get', params=params)
+        return self._parse_issues(text)
+
+    async def iter_project_issues(self, project_id, query=None, page_size=100,
+                                  offset=0, prefetch=True):
+        def fetch(offset):
+            coroutine = self.get_project_issues(
+                project_id, query=query, offset=offset, limit=page_size)
+            return asyncio.ensure_future(coroutine) if prefetch else coroutine
+
+        page = fetch(offset)
+        try:
+            while page is not None:
+                issues = await page
+                page = None
+                offset += len(issues)
+                if len(issues) >= page_size:
+                    page = fetch(offset)
+                for issue in issues:
+                    yield issue
+        finally:
+            # the caller stopped early, drop the page fetched ahead
+            if page is not None:
+                if prefetch:
+                    page.cancel()
+                else:
+                    page.close()
+
+    async def create_issue(self, data, key=None):
+        url = self.url + self.CREATE_URL
+        try:
+            text = await self.request(url, data=data, method='post')
+        except (requests.ConnectionError, requests.Timeout,
+                asyncio.TimeoutError):
+            if key is None:
+                raise
+            issues = await self.get_project_issues(
+                data['project'], query=key, limit=1)
+            if issues:
+                return issues[0]['id']
+            text = await self.request(url, data=data, method='post')
+        return self._parse(text).issue['id']
+
+    async def execute_command(self, issue, command):
+        url = self.url + self.COMMAND_URL.replace('<issue>', issue)
+        data = {'command': command}
+        return await self.request(url, data=data, method='post')
+
+    async def add_tags(self, issue, tags):
+        for tag in tags:
+            await self.execute_command(issue, 'add tag %s' % tag)
+
+    async def get_project_fields_list(self, project_id):
+        url = self.url + self.PROJECT_FIELDS.replace('<project_id>', project_id)
+        text = await self.request(url, method='get')
+        return list(self._parse_project_fields_list(text))
+
+    async def get_custom_fields_list(self):
+        text = await self.request(self.url + self.CUSTOM_FIELDS, method='get')
+        return list(self._parse_custom_fields_list(text))
+
+    async def get_project_fields(self, project_id, ignore_fields=None):
+        ignore_fields = ignore_fields or []
+        fields = await self.get_project_fields_list(project_id)
+        return await asyncio.gather(*[
+            self._get_custom_project_field_details(field)
+            for field in fields if field['name'] not in ignore_fields])
+
+
+class SyncYouTrackClient(object):
+    """
+    Blocking facade over `AsyncYouTrackClient` with the same method names.
+    The asyncio client runs on a private event loop in a background thread,
+    so tasks such as the next page of `iter_project_issues` keep running
+    while the caller works with the results.
+    """
+
+    def __init__(self, url, username=None, password=None, api_key=None,
+                 **kwargs):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        try:
+            if api_key is None:
+                self.client = self._run(AsyncYouTrackClient.login(
+                    url, username, password, **kwargs))
+            else:
+                self.client = AsyncYouTrackClient(
+                    url, api_key=api_key, **kwargs)
+        except Exception:
+            self._stop()
+            raise
+
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def _iterate(self, generator):
+        try:
+            while True:
+                try:
+                    item = self._run(generator.__anext__())
+                except StopAsyncIteration:
+                    return
+                yield item
+        finally:
+            self._run(generator.aclose())
+
+    def __getattr__(self, name):
+        attr = getattr(self.client, name)
+        if inspect.isasyncgenfunction(attr):
+            def method(*args, **kwargs):
+                return self._iterate(attr(*args, **kwargs))
+        elif asyncio.iscoroutinefunction(attr):
+            def method(*args, **kwargs):
+                return self._run(attr(*args, **kwargs))
+        else:
+            return attr
+        return method
+
+    def _stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    def close(self):
+        self._run(self.client.close())
+        self._stop()
@@ -0,0 +1,27 @@
+from django.apps import AppConfig
+from django.core.signals import request_started
+
+
+def warm_up_connections(**kwargs):
+    from .health import warm_up_in_background
+    warm_up_in_background()
+
+
+class YouTrackConfig(AppConfig):
+    name = 'sentry_youtrack'
+    verbose_name = "YouTrack"
+
+    def ready(self):
+        from .conf import youtrack_settings
+        if not youtrack_settings.PREWARM:
+            return
+        # worker processes are forked after the apps are loaded, so the
+        # connections are opened by every web and Celery worker on its own
+        request_started.connect(
+            warm_up_connections, dispatch_uid='youtrack_warm_up')
+        try:
+            from celery.signals import worker_process_init
+        except ImportError:
+            return
+        worker_process_init.connect(
+            warm_up_connections, dispatch_uid='youtrack_warm_up')
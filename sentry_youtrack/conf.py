@@ -0,0 +1,39 @@
+# -*- encoding: utf-8 -*-
+from django.conf import settings
+
+
+DEFAULTS = {
+    'VERIFY_SSL_CERTIFICATE': True,
+    'CACHE_CODEC': 'zlib',
+    'PROFILING': False,
+    'METADATA_STORE_PATH': None,
+    'DESCRIPTION_MAX_BYTES': 64 * 1024,
+    'ATTACH_EVENT': False,
+    'MAX_CONCURRENT_REQUESTS': 10,
+    'SHARED_CONCURRENCY_LIMIT': False,
+    'CLIENT_TTL': 300,
+    'RATE_LIMIT': None,
+    'RATE_LIMIT_BURST': None,
+    'PREWARM': False,
+    # names of the fields holding priorities and issue types, matched
+    # case-insensitively; the first one the project (or instance) has is used
+    'PRIORITY_FIELDS': [u'Priority', u'Приоритет', u'Priorität', u'Priorité',
+                        u'Prioridad', u'Priorità', u'Prioridade',
+                        u'Priorytet'],
+    'TYPE_FIELDS': [u'Type', u'Тип', u'Typ', u'Tipo'],
+}
+
+
+class YouTrackSettings(object):
+    """
+    The ``YOUTRACK_*`` Django settings. Values are read on access, so the
+    settings are not touched when the plugin is imported.
+    """
+
+    def __getattr__(self, name):
+        if name not in DEFAULTS:
+            raise AttributeError(name)
+        return getattr(settings, 'YOUTRACK_%s' % name, DEFAULTS[name])
+
+
+youtrack_settings = YouTrackSettings()
@@ -1,9 +1,9 @@
 # -*- encoding: utf-8 -*-
-from requests.exceptions import ConnectionError, HTTPError, SSLError
-from sentry.exceptions import PluginError
+from requests.exceptions import ConnectionError, HTTPError
 from django.utils.translation import ugettext_lazy as _
-from sentry_youtrack.forms import VERIFY_SSL_CERTIFICATE
-from sentry_youtrack.youtrack import YouTrackClient
+from sentry_youtrack.conf import youtrack_settings
+from sentry_youtrack.health import get_health, probe
+from sentry_youtrack.registry import get_registry
 
 
 class YouTrackConfiguration(object):
@@ -19,6 +19,13 @@ class YouTrackConfiguration(object):
         'perms': _("User doesn't have Low-level Administration permissions."),
         'required': _("This field is required.")}
 
+    # the form field a health check error is shown for
+    error_fields = {
+        'client': 'url',
+        'invalid_ssl': 'url',
+        'invalid_password': 'username',
+        'perms': 'username'}
+
     def __init__(self, initial):
         self.config = self.build_default_fields(initial)
         self.client_errors = {}
@@ -84,29 +91,28 @@ class YouTrackConfiguration(object):
             'url': data.get('url'),
             'username': data.get('username'),
             'password': data.get('password'),
-            'verify_ssl_certificate': VERIFY_SSL_CERTIFICATE}
+            'verify_ssl_certificate': youtrack_settings.VERIFY_SSL_CERTIFICATE}
         if additional_params:
             yt_settings.update(additional_params)
 
-        client = None
-        try:
-            client = YouTrackClient(**yt_settings)
-        except (HTTPError, ConnectionError) as e:
-            if e.response is not None and e.response.status_code == 403:
-                self.client_errors['username'] = self.error_message[
-                    'invalid_password']
-            else:
-                self.client_errors['url'] = self.error_message['client']
-        except (SSLError, TypeError) as e:
-            self.client_errors['url'] = self.error_message['invalid_ssl']
-        if client:
+        # a healthy record kept by the last probe, e.g. on worker boot, saves
+        # logging in again; failures are checked again, they may be fixed
+        self.health = get_health(
+            yt_settings['url'], yt_settings['username'],
+            yt_settings['password'])
+        if self.health is not None and self.health['error'] is None:
             try:
-                client.get_user(yt_settings.get('username'))
-            except HTTPError as e:
-                if e.response.status_code == 403:
-                    self.client_errors['username'] = self.error_message['perms']
-                    client = None
-        return client
+                return get_registry().get_client(**yt_settings)
+            except (HTTPError, ConnectionError, TypeError):
+                # the record is out of date
+                pass
+        self.health = probe(**yt_settings)
+        error = self.health['error']
+        if error:
+            self.client_errors[self.error_fields[error]] = \
+                self.error_message[error]
+            return None
+        return get_registry().get_client(**yt_settings)
 
     def get_ignore_field_choices(self, client, project):
         try:
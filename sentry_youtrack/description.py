@@ -0,0 +1,128 @@
+import json
+import re
+import zlib
+from datetime import date, datetime
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+
+FRAME_RE = re.compile(r'^(\s*)(File "|at )')
+
+# (head, tail) frames kept from every stacktrace, most recent calls are
+# at the end of the stacktrace so more of them are kept
+ELISION_LEVELS = [(5, 10), (2, 5), (1, 3), (0, 1)]
+
+ELIDED_FRAMES = '%s... %d frames elided ...'
+TRUNCATED = '\n... description truncated ...'
+
+
+def get_size(text):
+    return len(text.encode('utf-8'))
+
+
+def truncate_bytes(text, max_bytes):
+    return text.encode('utf-8')[:max_bytes].decode('utf-8', 'ignore')
+
+
+def split_frames(lines):
+    """
+    Splits lines into runs of plain lines and stacktraces, a stacktrace is
+    a list of frames and every frame a list of lines.
+    """
+    blocks = []
+    frames = None
+    indent = None
+    for line in lines:
+        match = FRAME_RE.match(line)
+        if match and (frames is None or len(match.group(1)) == indent):
+            if frames is None:
+                frames = []
+                indent = len(match.group(1))
+                blocks.append(frames)
+            frames.append([line])
+        elif (frames is not None and line.strip() and
+                len(line) - len(line.lstrip()) > indent):
+            frames[-1].append(line)
+        else:
+            frames = None
+            blocks.append(line)
+    return blocks
+
+
+def elide_frames(blocks, head, tail):
+    lines = []
+    for block in blocks:
+        if not isinstance(block, list):
+            lines.append(block)
+            continue
+        frames = block
+        if len(frames) > head + tail:
+            indent = FRAME_RE.match(frames[0][0]).group(1)
+            frames = (frames[:head] +
+                      [[ELIDED_FRAMES % (indent, len(frames) - head - tail)]] +
+                      frames[len(frames) - tail:])
+        for frame in frames:
+            lines.extend(frame)
+    return '\n'.join(lines)
+
+
+def truncate_description(text, max_bytes):
+    """
+    Fits the issue description into `max_bytes` bytes (UTF-8). Frames from
+    the middle of long stacktraces are elided first, the remaining text is
+    cut off only if that is not enough.
+    """
+    if not text or get_size(text) <= max_bytes:
+        return text
+
+    blocks = split_frames(text.split('\n'))
+    for head, tail in ELISION_LEVELS:
+        description = elide_frames(blocks, head, tail)
+        if get_size(description) <= max_bytes:
+            return description
+
+    limit = max(max_bytes - get_size(TRUNCATED), 0)
+    # the marker itself is cut when the limit is smaller than it
+    return truncate_bytes(truncate_bytes(description, limit) + TRUNCATED,
+                          max_bytes)
+
+
+def _default(value):
+    if isinstance(value, Mapping):
+        return dict(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return repr(value)
+
+
+def iter_event_payload(data):
+    """
+    Serializes event data to JSON chunk by chunk.
+    """
+    encoder = json.JSONEncoder(default=_default)
+    for chunk in encoder.iterencode(data):
+        yield chunk.encode('utf-8')
+
+
+def iter_gzip(chunks, level=6, buffer_size=64 * 1024):
+    """
+    Gzip-compresses a stream of byte chunks without building the whole
+    payload in memory.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    buffered = []
+    size = 0
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            buffered.append(data)
+            size += len(data)
+        if size >= buffer_size:
+            yield b''.join(buffered)
+            buffered = []
+            size = 0
+    buffered.append(compressor.flush())
+    yield b''.join(buffered)
@@ -0,0 +1,47 @@
+from hashlib import md5
+
+from django.utils.encoding import force_bytes
+
+
+def get_exception(data):
+    exception = data.get('exception') or data.get('sentry.interfaces.Exception')
+    if isinstance(exception, dict):
+        exception = exception.get('values')
+    if exception:
+        # the last exception is the one which was raised
+        return exception[-1]
+
+
+def get_frame_key(frame):
+    location = frame.get('module') or (frame.get('filename') or '').replace(
+        '\\', '/').rsplit('/', 1)[-1]
+    return '%s:%s' % (location, frame.get('function') or '?')
+
+
+def get_fingerprint(data, max_frames=5):
+    """
+    Returns a fingerprint of the error in the event data built from the
+    exception type and the top in-app frames. Line numbers, paths and
+    exception messages are left out, so the same root cause produces the
+    same fingerprint across releases and Sentry groups.
+    """
+    exception = get_exception(data)
+    if not exception:
+        return None
+    frames = (exception.get('stacktrace') or {}).get('frames') or []
+    in_app_frames = [frame for frame in frames if frame.get('in_app')]
+    frames = (in_app_frames or frames)[-max_frames:]
+    if not exception.get('type') and not frames:
+        return None
+    parts = [exception.get('type') or '']
+    parts.extend(get_frame_key(frame) for frame in frames)
+    return md5(force_bytes('\n'.join(parts))).hexdigest()
+
+
+def get_fingerprint_key(project_id, fingerprint):
+    """
+    Returns the cache key of the issue linked to `fingerprint` in the given
+    Sentry project. Every fingerprint has its own key, so links made at the
+    same time don't overwrite each other.
+    """
+    return 'youtrack:fingerprint:%s:%s' % (project_id, fingerprint)
@@ -1,17 +1,9 @@
 from hashlib import md5
 
 from django import forms
-from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.utils.encoding import force_bytes
 from django.utils.translation import ugettext_lazy as _
-from requests.exceptions import ConnectionError, HTTPError, SSLError
-
-from .youtrack import YouTrackClient
-
-
-VERIFY_SSL_CERTIFICATE = getattr(
-    settings, 'YOUTRACK_VERIFY_SSL_CERTIFICATE', True)
 
 
 class YouTrackProjectForm(forms.Form):
@@ -93,6 +85,7 @@ class NewIssueForm(YouTrackProjectForm):
         widget=forms.TextInput(attrs={
             'class': 'span6', 'placeholder': "e.g. sentry"}),
         required=False)
+    idempotency_key = forms.CharField(widget=forms.HiddenInput())
 
     def clean_description(self):
         description = self.cleaned_data.get('description')
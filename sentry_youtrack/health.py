@@ -0,0 +1,160 @@
+import logging
+import os
+import threading
+import time
+from hashlib import md5
+
+from django.utils.encoding import force_bytes
+from requests.exceptions import ConnectionError, HTTPError, SSLError
+
+from .conf import youtrack_settings
+from .registry import get_registry
+from .scheduler import BACKGROUND, priority
+
+
+logger = logging.getLogger(__name__)
+
+HEALTH_TIMEOUT = 600
+# failed checks are repeated sooner, the problem may be fixed by then
+FAILURE_TIMEOUT = 60
+
+_warmed_up_pid = None
+_warm_up_lock = threading.Lock()
+
+
+def get_health_key(url, username, password):
+    credentials = md5(force_bytes('%s:%s:%s' % (
+        (url or '').rstrip('/'), username, password)))
+    return 'youtrack:health:%s' % credentials.hexdigest()
+
+
+def check_instance(url, username, password, verify_ssl_certificate=True,
+                   registry=None):
+    """
+    Logs in to the YouTrack instance, or reuses the pooled client, and
+    fetches the user, which is about the cheapest authenticated request.
+    Returns a health record; `error` is one of the `YouTrackConfiguration`
+    error message keys.
+    """
+    if registry is None:
+        registry = get_registry()
+    record = {
+        'url': (url or '').rstrip('/'),
+        'checked_at': time.time(),
+        'latency': None,
+        'auth_ok': False,
+        'tls_ok': None,
+        'error': None}
+    secure = record['url'].startswith('https://')
+    start = time.time()
+    try:
+        client = registry.get_client(
+            url, username=username, password=password,
+            verify_ssl_certificate=verify_ssl_certificate)
+    except (SSLError, TypeError):
+        record['error'] = 'invalid_ssl'
+        record['tls_ok'] = False if secure else None
+    except (HTTPError, ConnectionError) as e:
+        if e.response is not None:
+            record['tls_ok'] = True if secure else None
+        if e.response is not None and e.response.status_code == 403:
+            record['error'] = 'invalid_password'
+        else:
+            record['error'] = 'client'
+    else:
+        record['auth_ok'] = True
+        record['tls_ok'] = True if secure else None
+        try:
+            client.get_user(username)
+        except (HTTPError, ConnectionError) as e:
+            # only missing permissions block the configuration, the user
+            # can't be fetched for other reasons
+            if e.response is not None and e.response.status_code == 403:
+                record['error'] = 'perms'
+    record['latency'] = time.time() - start
+    return record
+
+
+def get_health(url, username, password, cache=None):
+    if cache is None:
+        from sentry.utils.cache import cache
+    return cache.get(get_health_key(url, username, password))
+
+
+def probe(url, username, password, verify_ssl_certificate=True,
+          registry=None, cache=None):
+    """
+    Checks the instance and keeps the result as its health record.
+    """
+    if cache is None:
+        from sentry.utils.cache import cache
+    record = check_instance(url, username, password, verify_ssl_certificate,
+                            registry=registry)
+    timeout = HEALTH_TIMEOUT if record['error'] is None else FAILURE_TIMEOUT
+    cache.set(get_health_key(url, username, password), record, timeout)
+    return record
+
+
+def get_configured_instances(prefix='youtrack'):
+    """
+    Returns the distinct (url, username, password) of all projects with
+    the plugin configured.
+    """
+    from sentry.models import ProjectOption
+    names = ['enabled', 'url', 'username', 'password']
+    options = {}
+    for project_id, key, value in ProjectOption.objects.filter(
+            key__in=['%s:%s' % (prefix, name) for name in names]).values_list(
+                'project_id', 'key', 'value'):
+        options.setdefault(project_id, {})[key.split(':', 1)[1]] = value
+
+    instances = set()
+    for values in options.values():
+        if values.get('enabled') is False:
+            continue
+        if values.get('url') and values.get('username') and \
+                values.get('password'):
+            instances.add((values['url'].rstrip('/'), values['username'],
+                           values['password']))
+    return sorted(instances)
+
+
+def warm_up(instances=None, registry=None, cache=None):
+    """
+    Opens pooled connections to the configured YouTrack instances and
+    probes them. Returns the health records.
+    """
+    if instances is None:
+        instances = get_configured_instances()
+    records = []
+    with priority(BACKGROUND):
+        for url, username, password in instances:
+            records.append(probe(
+                url, username, password,
+                youtrack_settings.VERIFY_SSL_CERTIFICATE,
+                registry=registry, cache=cache))
+    return records
+
+
+def warm_up_in_background():
+    """
+    Runs `warm_up` in a background thread, once per process.
+    """
+    global _warmed_up_pid
+    with _warm_up_lock:
+        if _warmed_up_pid == os.getpid():
+            return
+        _warmed_up_pid = os.getpid()
+
+    def run():
+        from django.db import connection
+        try:
+            warm_up()
+        except Exception:
+            logger.exception('Unable to warm up YouTrack connections')
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=run)
+    thread.daemon = True
+    thread.start()
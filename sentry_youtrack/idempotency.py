@@ -0,0 +1,87 @@
+import time
+from hashlib import md5
+
+from django.utils.encoding import force_bytes
+
+
+class IdempotencyError(Exception):
+    pass
+
+
+def get_idempotency_key(*parts):
+    return md5(force_bytes(':'.join(map(str, parts)))).hexdigest()
+
+
+class IdempotentCall(object):
+    """
+    Runs a function at most once per key. The result is kept in the cache
+    and optionally in a persistent store (`lookup`/`save` callables), and
+    concurrent calls with the same key wait for the running one instead of
+    calling the function again.
+    """
+
+    def __init__(self, key, cache, lookup=None, save=None, lock_timeout=120,
+                 result_timeout=24 * 3600, wait_timeout=30,
+                 poll_interval=0.2):
+        self.key = key
+        self.cache = cache
+        self.lookup = lookup
+        self.save = save
+        self.lock_timeout = lock_timeout
+        self.result_timeout = result_timeout
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+
+    @property
+    def lock_key(self):
+        return 'youtrack:idempotency:%s:lock' % self.key
+
+    @property
+    def result_key(self):
+        return 'youtrack:idempotency:%s' % self.key
+
+    def get_result(self):
+        result = self.cache.get(self.result_key)
+        if result is None and self.lookup is not None:
+            result = self.lookup()
+            if result is not None:
+                self.cache.set(self.result_key, result, self.result_timeout)
+        return result
+
+    def set_result(self, result):
+        self.cache.set(self.result_key, result, self.result_timeout)
+        if self.save is not None:
+            self.save(result)
+
+    def wait_for_result(self):
+        deadline = time.time() + self.wait_timeout
+        while time.time() < deadline:
+            time.sleep(self.poll_interval)
+            result = self.get_result()
+            if result is not None:
+                return result
+            if self.cache.add(self.lock_key, 1, self.lock_timeout):
+                # the other call failed, let the caller try again
+                self.cache.delete(self.lock_key)
+                break
+        raise IdempotencyError(self.key)
+
+    def __call__(self, func, *args, **kwargs):
+        """
+        Returns a tuple of the result and a flag which is set if the result
+        was created by this call.
+        """
+        result = self.get_result()
+        if result is not None:
+            return result, False
+        if not self.cache.add(self.lock_key, 1, self.lock_timeout):
+            return self.wait_for_result(), False
+        try:
+            result = self.get_result()
+            if result is not None:
+                return result, False
+            result = func(*args, **kwargs)
+            self.set_result(result)
+            return result, True
+        finally:
+            self.cache.delete(self.lock_key)
@@ -0,0 +1,55 @@
+import threading
+from contextlib import contextmanager
+
+
+def load_project_options(project):
+    from sentry.models import ProjectOption
+    return ProjectOption.objects.get_all_values(project)
+
+
+class OptionsSnapshot(object):
+    """
+    Request-scoped snapshot of plugin options. While a snapshot is active
+    all options of a project with the given prefix are loaded with one
+    `loader` call and reused until the snapshot ends or is invalidated.
+    """
+
+    def __init__(self, prefix, loader=load_project_options):
+        self.prefix = prefix
+        self.loader = loader
+        self.local = threading.local()
+
+    @contextmanager
+    def activate(self):
+        depth = getattr(self.local, 'depth', 0)
+        if not depth:
+            self.local.projects = {}
+        self.local.depth = depth + 1
+        try:
+            yield self
+        finally:
+            self.local.depth -= 1
+            if not self.local.depth:
+                self.local.projects = {}
+
+    def is_active(self):
+        return bool(getattr(self.local, 'depth', 0))
+
+    def get_values(self, project):
+        projects = self.local.projects
+        if project.id not in projects:
+            projects[project.id] = dict(
+                (key, value) for key, value in self.loader(project).items()
+                if key.startswith(self.prefix))
+        return projects[project.id]
+
+    def get(self, project, key, default=None):
+        return self.get_values(project).get(self.prefix + key, default)
+
+    def invalidate(self, project=None):
+        if not self.is_active():
+            return
+        if project is None:
+            self.local.projects = {}
+        else:
+            self.local.projects.pop(project.id, None)
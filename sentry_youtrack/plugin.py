@@ -1,21 +1,62 @@
 # -*- encoding: utf-8 -*-
 import json
+import logging
+import threading
+import uuid
+from functools import partial
 
+from django.core.exceptions import ValidationError
 from django.core.serializers.json import DjangoJSONEncoder
 from django.http import HttpResponse
+from django.utils.http import urlencode
 from django.utils.translation import ugettext_lazy as _
 from sentry.models import GroupMeta
+from sentry.utils.cache import cache
 from sentry_plugins.base import CorePluginMixin
 from sentry.plugins.bases.issue import IssuePlugin
 from sentry.exceptions import PluginError
 from sentry.integrations import FeatureDescription, IntegrationFeatures
 
 from . import VERSION
-from .forms import (NewIssueForm, AssignIssueForm, DefaultFieldForm,
-                    YouTrackProjectForm, VERIFY_SSL_CERTIFICATE)
-from .utils import cache_this, get_int
-from .youtrack import YouTrackClient
-from sentry_youtrack.configuration import YouTrackConfiguration
+from .conf import youtrack_settings
+from .description import (
+    get_size, iter_event_payload, iter_gzip, truncate_description)
+from .fingerprint import get_fingerprint, get_fingerprint_key
+from .idempotency import (
+    IdempotencyError, IdempotentCall, get_idempotency_key)
+from .options import OptionsSnapshot
+from .profiling import get_trace, trace
+from .registry import get_registry
+from .serialization import pack_project_fields, unpack_project_fields
+from .store import MetadataStore
+from .utils import LazyImport, cache_this, get_int
+
+
+# proxies commonly limit a single header to 4-8KB
+TRACE_HEADER_MAX_BYTES = 4096
+
+ISSUE_KEY_LINE = '\n\nSentry issue key: %s'
+# a request waiting for the same form submitted before holds a web worker
+IDEMPOTENCY_WAIT_TIMEOUT = 5
+
+# links of errors which haven't come back for this long are forgotten
+FINGERPRINT_TIMEOUT = 90 * 24 * 3600
+
+logger = logging.getLogger(__name__)
+
+_metadata_store = None
+_metadata_store_lock = threading.Lock()
+
+
+def get_metadata_store():
+    global _metadata_store
+    path = youtrack_settings.METADATA_STORE_PATH
+    if not path:
+        return None
+    with _metadata_store_lock:
+        if _metadata_store is None or _metadata_store.path != path:
+            _metadata_store = MetadataStore(path)
+        return _metadata_store
 
 
 class YouTrackPlugin(CorePluginMixin, IssuePlugin):
@@ -27,13 +68,21 @@ class YouTrackPlugin(CorePluginMixin, IssuePlugin):
     conf_title = title
     conf_key = slug
     description = "Integration with Youtrack"
-    new_issue_form = NewIssueForm
-    assign_issue_form = AssignIssueForm
+    # forms are imported on first use, so loading the plugin entry point
+    # stays cheap for processes which never talk to YouTrack
+    new_issue_form = LazyImport('sentry_youtrack.forms', 'NewIssueForm')
+    assign_issue_form = LazyImport('sentry_youtrack.forms', 'AssignIssueForm')
     create_issue_template = "sentry_youtrack/create_issue_form.html"
     assign_issue_template = "sentry_youtrack/assign_issue_form.html"
     project_conf_template = "sentry_youtrack/project_conf_form.html"
-    project_fields_form = YouTrackProjectForm
+    project_fields_form = LazyImport(
+        'sentry_youtrack.forms', 'YouTrackProjectForm')
+    default_field_form = LazyImport(
+        'sentry_youtrack.forms', 'DefaultFieldForm')
     default_fields_key = 'default_fields'
+    idempotency_key = 'idempotency'
+    profiling_param = 'yt_profile'
+    options_snapshot = OptionsSnapshot('%s:' % slug)
 
     feature_descriptions = [
         FeatureDescription(
@@ -55,30 +104,59 @@ class YouTrackPlugin(CorePluginMixin, IssuePlugin):
         (_("Bug Tracker"), "https://github.com/getsentry/sentry-youtrack/issues/"),
         (_("Source"), "https://github.com/getsentry/sentry-youtrack/")]
 
+    def get_option(self, key, project=None, user=None):
+        if (project is not None and user is None and
+                self.options_snapshot.is_active()):
+            return self.options_snapshot.get(project, key)
+        return super(YouTrackPlugin, self).get_option(key, project, user)
+
+    def set_option(self, key, value, project=None, user=None):
+        super(YouTrackPlugin, self).set_option(key, value, project, user)
+        self.options_snapshot.invalidate(project)
+
+    def reset_options(self, project=None, user=None):
+        super(YouTrackPlugin, self).reset_options(project, user)
+        self.options_snapshot.invalidate(project)
+
     def is_configured(self, request, project, **kwargs):
         return bool(self.get_option('project', project))
 
-    def get_youtrack_client(self, project):
-        settings = {
+    def get_youtrack_client_settings(self, project):
+        return {
             'url': self.get_option('url', project),
             'username': self.get_option('username', project),
             'password': self.get_option('password', project),
-            'verify_ssl_certificate': VERIFY_SSL_CERTIFICATE}
-        return YouTrackClient(**settings)
+            'verify_ssl_certificate': youtrack_settings.VERIFY_SSL_CERTIFICATE}
+
+    def get_youtrack_client(self, project):
+        settings = self.get_youtrack_client_settings(project)
+        return get_registry().get_client(**settings)
 
     def get_project_fields(self, project):
-        @cache_this(600)
-        def cached_fields(ignore_fields):
-            yt_client = self.get_youtrack_client(project)
-            return list(yt_client.get_project_fields(
-                self.get_option('project', project), ignore_fields))
-        return cached_fields(self.get_option('ignore_fields', project))
+        # the fields may be refreshed in a background thread, so everything
+        # read from the database is resolved up front
+        settings = self.get_youtrack_client_settings(project)
+
+        @cache_this(600,
+                    dumps=partial(pack_project_fields,
+                                  codec=youtrack_settings.CACHE_CODEC),
+                    loads=unpack_project_fields,
+                    store=get_metadata_store())
+        def cached_fields(url, project_id, ignore_fields):
+            yt_client = get_registry().get_client(**settings)
+            return list(yt_client.get_project_fields(project_id, ignore_fields))
+        return cached_fields(settings['url'],
+                             self.get_option('project', project),
+                             self.get_option('ignore_fields', project))
 
     def get_initial_form_data(self, request, group, event, **kwargs):
         initial = {
             'title': self._get_group_title(request, group, event),
-            'description': self._get_group_description(request, group, event),
+            'description': truncate_description(
+                self._get_group_description(request, group, event),
+                youtrack_settings.DESCRIPTION_MAX_BYTES),
             'tags': self.get_option('default_tags', group.project),
+            'idempotency_key': uuid.uuid4().hex,
             'default_fields': self.get_option(
                 self.default_fields_key, group.project)}
         return initial
@@ -90,10 +168,34 @@ class YouTrackPlugin(CorePluginMixin, IssuePlugin):
         return _("Assign existing YouTrack issue")
 
     def get_new_issue_form(self, request, group, event, **kwargs):
-        return self.new_issue_form(
+        form = self.new_issue_form(
             project_fields=self.get_project_fields(group.project),
             data=request.POST or None,
             initial=self.get_initial_form_data(request, group, event))
+        form.suggested_issue = self.get_suggested_issue(group.project, event)
+        if form.suggested_issue:
+            form.suggested_issue_url = self.get_issue_url(
+                group, form.suggested_issue)
+            form.assign_suggested_issue_url = "%s?%s" % (
+                self.get_url(group),
+                urlencode({'action': 'assign_issue',
+                           'issue': form.suggested_issue}))
+        return form
+
+    def get_suggested_issue(self, project, event):
+        """
+        Returns the id of an issue already linked to an error with the same
+        fingerprint, looked up in the local index only.
+        """
+        fingerprint = get_fingerprint(event.data) if event else None
+        if fingerprint:
+            return cache.get(get_fingerprint_key(project.id, fingerprint))
+
+    def add_to_fingerprint_index(self, project, event, issue_id):
+        fingerprint = get_fingerprint(event.data) if event else None
+        if fingerprint:
+            cache.set(get_fingerprint_key(project.id, fingerprint), issue_id,
+                      FINGERPRINT_TIMEOUT)
 
     def create_issue(self, request, group, form_data, **kwargs):
         project_fields = self.get_project_fields(group.project)
@@ -103,12 +205,31 @@ class YouTrackPlugin(CorePluginMixin, IssuePlugin):
         tags = [_f for _f in [x.strip() for x in form_data['tags'].split(',')] if _f]
         yt_client = self.get_youtrack_client(group.project)
 
+        # the same form submitted twice (or retried) creates one issue only,
+        # the key is also kept in the issue to find it after a lost request
+        key = get_idempotency_key(group.id, form_data['idempotency_key'])
+        key_line = ISSUE_KEY_LINE % key
         issue_data = {
             'project': self.get_option('project', group.project),
             'summary': form_data.get('title'),
-            'description': form_data.get('description')}
-        issue_id = yt_client.create_issue(issue_data)
-
+            'description': truncate_description(
+                form_data.get('description'),
+                youtrack_settings.DESCRIPTION_MAX_BYTES - get_size(key_line)
+            ) + key_line}
+        create = IdempotentCall(
+            key, cache,
+            lookup=partial(self.get_created_issue, group, key),
+            save=partial(self.set_created_issue, group, key),
+            wait_timeout=IDEMPOTENCY_WAIT_TIMEOUT)
+        try:
+            issue_id, created = create(
+                yt_client.create_issue, issue_data, key=key)
+        except IdempotencyError:
+            raise ValidationError(
+                _("The issue is still being created, please try again."))
+
+        # repeated for an existing issue, the previous attempt may have
+        # failed before they were set
         for field, value in project_field_values.items():
             if value:
                 value = [value] if type(value) != list else value
@@ -116,8 +237,36 @@ class YouTrackPlugin(CorePluginMixin, IssuePlugin):
                 yt_client.execute_command(issue_id, " ".join(cmd))
         if tags:
             yt_client.add_tags(issue_id, tags)
+
+        event = group.get_latest_event()
+        self.add_to_fingerprint_index(group.project, event, issue_id)
+        # the upload may be large, the issue is complete before it starts
+        if created and youtrack_settings.ATTACH_EVENT and event is not None:
+            self.attach_event(yt_client, issue_id, event)
         return issue_id
 
+    def get_created_issue(self, group, key):
+        value = GroupMeta.objects.get_value(
+            group, '%s:%s' % (self.get_conf_key(), self.idempotency_key), None)
+        if value:
+            value_key, _sep, issue_id = value.partition(':')
+            if value_key == key:
+                return issue_id
+
+    def set_created_issue(self, group, key, issue_id):
+        GroupMeta.objects.set_value(
+            group, '%s:%s' % (self.get_conf_key(), self.idempotency_key),
+            '%s:%s' % (key, issue_id))
+
+    def attach_event(self, yt_client, issue_id, event):
+        filename = 'sentry-event-%s.json.gz' % event.event_id
+        try:
+            yt_client.add_attachment(
+                issue_id, filename, iter_gzip(iter_event_payload(event.data)),
+                content_type='application/gzip')
+        except Exception:
+            logger.exception('Unable to attach event to %s', issue_id)
+
     def get_issue_url(self, group, issue_id, **kwargs):
         url = self.get_option('url', group.project).rstrip('/')
         link = "%s/issue/%s" % (url, issue_id)
@@ -128,6 +277,20 @@ class YouTrackPlugin(CorePluginMixin, IssuePlugin):
             return self.view(request, group)
         return super(YouTrackPlugin, self).get_view_response(request, group)
 
+    def get_issue_ids(self, groups):
+        """
+        Returns a mapping of group id to the linked YouTrack issue id. The
+        GroupMeta values of all groups are fetched with a single query.
+        """
+        key = '%s:tid' % self.get_conf_key()
+        GroupMeta.objects.populate_cache(groups)
+        issue_ids = {}
+        for group in groups:
+            issue_id = GroupMeta.objects.get_value(group, key, None)
+            if issue_id:
+                issue_ids[group.id] = issue_id
+        return issue_ids
+
     def actions(self, request, group, action_list, **kwargs):
         action_list = (super(YouTrackPlugin, self)
                        .actions(request, group, action_list, **kwargs))
@@ -145,14 +308,35 @@ class YouTrackPlugin(CorePluginMixin, IssuePlugin):
             if request.GET.get('action') and hasattr(self, action_view):
                 return getattr(self, action_view)
         view = get_action_view() or super(YouTrackPlugin, self).view
-        return view(request, group, **kwargs)
+        with self.options_snapshot.activate():
+            with trace(self.is_profiling(request)) as call_trace:
+                response = view(request, group, **kwargs)
+        if call_trace is not None and isinstance(response, HttpResponse):
+            response['X-YouTrack-Trace'] = call_trace.to_json(
+                TRACE_HEADER_MAX_BYTES)
+        return response
+
+    def is_profiling(self, request):
+        if youtrack_settings.PROFILING:
+            return True
+        return bool(request.user.is_staff and
+                    request.GET.get(self.profiling_param))
+
+    def render(self, template, context=None):
+        call_trace = get_trace()
+        if call_trace is not None:
+            context = dict(context or {}, youtrack_trace=call_trace)
+        return super(YouTrackPlugin, self).render(template, context)
 
     def assign_issue_view(self, request, group):
-        form = self.assign_issue_form(request.POST or None)
+        form = self.assign_issue_form(
+            request.POST or None, initial={'issue': request.GET.get('issue')})
         if form.is_valid():
             issue_id = form.cleaned_data['issue']
             prefix = self.get_conf_key()
             GroupMeta.objects.set_value(group, '%s:tid' % prefix, issue_id)
+            self.add_to_fingerprint_index(
+                group.project, group.get_latest_event(), issue_id)
             return self.redirect(group.get_absolute_url())
         context = {
             'form': form,
@@ -176,7 +360,8 @@ class YouTrackPlugin(CorePluginMixin, IssuePlugin):
         return HttpResponse(json.dumps(data, cls=DjangoJSONEncoder))
 
     def save_field_as_default_view(self, request, group):
-        form = DefaultFieldForm(self, group.project, request.POST or None)
+        form = self.default_field_form(
+            self, group.project, request.POST or None)
         if form.is_valid():
             form.save()
         return HttpResponse()
@@ -185,6 +370,10 @@ class YouTrackPlugin(CorePluginMixin, IssuePlugin):
         return True
 
     def get_config(self, project, user, **kwargs):
+        with self.options_snapshot.activate():
+            return self._get_config(project, user, **kwargs)
+
+    def _get_config(self, project, user, **kwargs):
         initial = {
             'project': self.get_option('project', project),
             'url': self.get_option('url', project),
@@ -194,10 +383,15 @@ class YouTrackPlugin(CorePluginMixin, IssuePlugin):
         # filtering out null values
         initial = dict((k, v) for k, v in initial.items() if v)
 
+        from .configuration import YouTrackConfiguration
         self.config_form = YouTrackConfiguration(initial)
         return self.config_form.config
 
     def validate_config(self, project, config, actor):
+        with self.options_snapshot.activate():
+            return self._validate_config(project, config, actor)
+
+    def _validate_config(self, project, config, actor):
         super(YouTrackPlugin, self).validate_config(project, config, actor)
         errors = self.config_form.client_errors
         for key, message in errors.items():
@@ -0,0 +1,122 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+
+_local = threading.local()
+
+
+class CallTrace(object):
+    """
+    Records YouTrack requests and cache lookups made while handling a
+    single Django request.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.calls = []
+
+    def record_request(self, method, url, started, duration, size, status,
+                       queued=0.0):
+        """
+        `queued` is the time spent waiting before the request was sent
+        (request scheduler, rate limit pauses), `duration` the time spent
+        sending it and reading the response.
+        """
+        self.calls.append({
+            'kind': 'request',
+            'method': method.upper(),
+            'url': url,
+            'offset': started - self.started,
+            'queued': queued,
+            'duration': duration,
+            'bytes': size,
+            'status': status,
+            'parse_time': 0.0})
+
+    def record_parse(self, duration):
+        for call in reversed(self.calls):
+            if call['kind'] == 'request':
+                call['parse_time'] += duration
+                return
+
+    def record_cache(self, name, hit):
+        self.calls.append({
+            'kind': 'cache',
+            'method': 'CACHE',
+            'url': name,
+            'offset': time.time() - self.started,
+            'queued': 0.0,
+            'duration': 0.0,
+            'bytes': 0,
+            'status': 'hit' if hit else 'miss',
+            'parse_time': 0.0})
+
+    @property
+    def total(self):
+        return max([call['offset'] + call['queued'] + call['duration'] +
+                    call['parse_time'] for call in self.calls] or [0.0])
+
+    def rows(self):
+        """
+        Calls with waterfall bar positions expressed in percent.
+        """
+        total = self.total or 1.0
+        for call in self.calls:
+            row = dict(call)
+            row['queue_ms'] = int(call['queued'] * 1000)
+            row['duration_ms'] = int(call['duration'] * 1000)
+            row['parse_ms'] = int(call['parse_time'] * 1000)
+            row['queue_left'] = round(100 * call['offset'] / total, 2)
+            row['queue_width'] = round(100 * call['queued'] / total, 2)
+            row['left'] = round(
+                100 * (call['offset'] + call['queued']) / total, 2)
+            row['width'] = max(
+                round(100 * (call['duration'] + call['parse_time']) / total,
+                      2), 0.5)
+            yield row
+
+    def to_json(self, max_bytes=None):
+        """
+        Serializes the trace. With `max_bytes` the last calls are left out
+        until the result fits, `truncated` is the number of calls left out.
+        """
+        calls = [dict((key, round(value, 4)
+                       if isinstance(value, float) else value)
+                      for key, value in call.items())
+                 for call in self.calls]
+        data = {'total': round(self.total, 4), 'calls': calls}
+        result = json.dumps(data)
+        while max_bytes is not None and len(result) > max_bytes and calls:
+            calls.pop()
+            data['truncated'] = len(self.calls) - len(calls)
+            result = json.dumps(data)
+        return result
+
+
+@contextmanager
+def trace(enabled=True):
+    if not enabled:
+        yield None
+        return
+    with use_trace(CallTrace()) as call_trace:
+        yield call_trace
+
+
+@contextmanager
+def use_trace(call_trace):
+    """
+    Records the calls of the current thread into `call_trace`, e.g. the
+    trace of the thread which started it.
+    """
+    previous = getattr(_local, 'trace', None)
+    _local.trace = call_trace
+    try:
+        yield call_trace
+    finally:
+        _local.trace = previous
+
+
+def get_trace():
+    return getattr(_local, 'trace', None)
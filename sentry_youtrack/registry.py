@@ -0,0 +1,163 @@
+import logging
+import threading
+import time
+from functools import partial
+from hashlib import md5
+
+from django.utils.encoding import force_bytes
+
+from .conf import youtrack_settings
+from .scheduler import INTERACTIVE, RequestScheduler, report_queue_stats
+
+
+logger = logging.getLogger(__name__)
+
+
+class CacheSemaphore(object):
+    """
+    Semaphore shared between processes through the cache. Every slot is a
+    separate cache key taken with an atomic `add`, so slots held by crashed
+    processes are released after `lock_timeout` seconds.
+
+    Waiting processes poll for a free slot in no particular order, so
+    background requests never take the last `reserved` slots. Interactive
+    requests only wait for other interactive requests then.
+    """
+
+    def __init__(self, key, max_requests, cache=None, lock_timeout=60,
+                 poll_interval=0.05, reserved=1):
+        if cache is None:
+            from sentry.utils.cache import cache
+        self.cache = cache
+        self.key = key
+        self.max_requests = max_requests
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        self.reserved = reserved
+        self.local = threading.local()
+
+    def get_slots(self, priority_value):
+        if priority_value == INTERACTIVE:
+            return range(self.max_requests)
+        return range(max(self.max_requests - self.reserved, 1))
+
+    def acquire(self, priority_value=INTERACTIVE):
+        while True:
+            for slot in self.get_slots(priority_value):
+                slot_key = '%s:%s' % (self.key, slot)
+                if self.cache.add(slot_key, 1, self.lock_timeout):
+                    self.local.slot_key = slot_key
+                    return
+            time.sleep(self.poll_interval)
+
+    def release(self):
+        slot_key = getattr(self.local, 'slot_key', None)
+        if slot_key is not None:
+            self.cache.delete(slot_key)
+            self.local.slot_key = None
+
+
+class ClientRegistry(object):
+    """
+    Reuses `YouTrackClient` instances (and their connection pools) per
+    instance url and credentials. All clients of one YouTrack instance
+    share a single `RequestScheduler`.
+    """
+
+    # the client (and the HTTP and XML parsing stack) is imported on first
+    # use, see `get_client`
+    client_class = None
+
+    def __init__(self, max_requests=10, shared=False, ttl=300, rate=None,
+                 burst=None, report=report_queue_stats):
+        self.max_requests = max_requests
+        self.shared = shared
+        self.ttl = ttl
+        self.rate = rate
+        self.burst = burst
+        self.report = report
+        self.lock = threading.Lock()
+        self.clients = {}
+        self.schedulers = {}
+
+    def get_instance_key(self, url):
+        return (url or '').rstrip('/')
+
+    def get_client_key(self, url, username, password, verify_ssl_certificate):
+        credentials = md5(force_bytes('%s:%s' % (username, password)))
+        return (self.get_instance_key(url), credentials.hexdigest(),
+                verify_ssl_certificate)
+
+    def get_scheduler(self, url):
+        instance = self.get_instance_key(url)
+        with self.lock:
+            if instance not in self.schedulers:
+                shared_semaphore = None
+                if self.shared:
+                    key = 'youtrack:inflight:%s' % md5(
+                        force_bytes(instance)).hexdigest()
+                    shared_semaphore = CacheSemaphore(key, self.max_requests)
+                self.schedulers[instance] = RequestScheduler(
+                    instance, self.max_requests, rate=self.rate,
+                    burst=self.burst, shared_semaphore=shared_semaphore,
+                    report=self.report)
+            return self.schedulers[instance]
+
+    def get_client(self, url, username=None, password=None,
+                   verify_ssl_certificate=True):
+        key = self.get_client_key(
+            url, username, password, verify_ssl_certificate)
+        with self.lock:
+            client, created_at = self.clients.get(key, (None, None))
+        if client is not None and time.time() - created_at < self.ttl:
+            return client
+
+        client_class = self.client_class
+        if client_class is None:
+            from .youtrack import YouTrackClient as client_class
+        client = client_class(
+            url, username=username, password=password,
+            verify_ssl_certificate=verify_ssl_certificate,
+            limiter=self.get_scheduler(url),
+            on_session_expired=partial(
+                self.renew_client, url, username, password,
+                verify_ssl_certificate))
+        with self.lock:
+            self.clients[key] = (client, time.time())
+        return client
+
+    def renew_client(self, url, username, password, verify_ssl_certificate,
+                     client):
+        """
+        Replaces `client`, whose session YouTrack dropped, with a freshly
+        logged in one.
+        """
+        key = self.get_client_key(
+            url, username, password, verify_ssl_certificate)
+        with self.lock:
+            if self.clients.get(key, (None,))[0] is client:
+                del self.clients[key]
+        return self.get_client(
+            url, username, password, verify_ssl_certificate)
+
+    def clear(self):
+        with self.lock:
+            self.clients.clear()
+            self.schedulers.clear()
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ClientRegistry(
+                max_requests=youtrack_settings.MAX_CONCURRENT_REQUESTS,
+                shared=youtrack_settings.SHARED_CONCURRENCY_LIMIT,
+                ttl=youtrack_settings.CLIENT_TTL,
+                rate=youtrack_settings.RATE_LIMIT,
+                burst=youtrack_settings.RATE_LIMIT_BURST)
+        return _registry
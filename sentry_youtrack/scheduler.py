@@ -0,0 +1,178 @@
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+
+INTERACTIVE = 0
+BACKGROUND = 1
+
+PRIORITY_NAMES = {
+    INTERACTIVE: 'interactive',
+    BACKGROUND: 'background'}
+
+_local = threading.local()
+
+
+def get_priority():
+    return getattr(_local, 'priority', INTERACTIVE)
+
+
+@contextmanager
+def priority(value):
+    """
+    Sets the priority class of the YouTrack requests made by the current
+    thread, e.g. ``with priority(BACKGROUND): warm_up()``.
+    """
+    previous = get_priority()
+    _local.priority = value
+    try:
+        yield
+    finally:
+        _local.priority = previous
+
+
+def report_queue_stats(instance, priority_name, wait, depth):
+    from sentry.utils import metrics
+    tags = {'priority': priority_name}
+    metrics.timing('youtrack.request.queue_wait', wait, instance=instance,
+                   tags=tags)
+    metrics.gauge('youtrack.request.queue_depth', depth, instance=instance,
+                  tags=tags)
+
+
+class TokenBucket(object):
+    """
+    Allows `rate` requests per second on average and bursts of up to
+    `burst` requests.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst or max(rate, 1))
+        self.tokens = self.burst
+        self.updated = time.time()
+
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def get_delay(self, now):
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+
+class RequestScheduler(object):
+    """
+    Schedules the requests sent to a single YouTrack instance. At most
+    `max_requests` requests are in flight, optionally limited by a token
+    bucket, and waiting requests are started in priority order, so
+    interactive requests always jump ahead of queued background work.
+    """
+
+    def __init__(self, instance, max_requests, rate=None, burst=None,
+                 shared_semaphore=None, report=report_queue_stats):
+        self.instance = instance
+        self.max_requests = max_requests
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.shared_semaphore = shared_semaphore
+        self.report = report
+        self.condition = threading.Condition()
+        self.counter = itertools.count()
+        self.queue = []
+        self.running = 0
+        self.paused_until = 0
+        self.waits = dict((value, [0, 0.0]) for value in PRIORITY_NAMES)
+
+    def _get_delay(self, now):
+        delay = self.paused_until - now
+        if self.bucket is not None:
+            delay = max(delay, self.bucket.get_delay(now))
+        return delay
+
+    def get_queue_depth(self, priority_value):
+        return len([ticket for ticket in self.queue
+                    if ticket[0] == priority_value])
+
+    def acquire(self, priority_value=None):
+        if priority_value is None:
+            priority_value = get_priority()
+        start = time.time()
+        with self.condition:
+            ticket = (priority_value, next(self.counter))
+            heapq.heappush(self.queue, ticket)
+            depth = self.get_queue_depth(priority_value)
+            while True:
+                if (self.queue[0] == ticket and
+                        self.running < self.max_requests):
+                    now = time.time()
+                    delay = self._get_delay(now)
+                    if delay <= 0:
+                        break
+                    self.condition.wait(delay)
+                else:
+                    self.condition.wait()
+            heapq.heappop(self.queue)
+            self.running += 1
+            if self.bucket is not None:
+                self.bucket.consume(time.time())
+            self.condition.notify_all()
+
+        if self.shared_semaphore is not None:
+            try:
+                self.shared_semaphore.acquire(priority_value)
+            except Exception:
+                self.release()
+                raise
+
+        wait = time.time() - start
+        with self.condition:
+            self.waits[priority_value][0] += 1
+            self.waits[priority_value][1] += wait
+        if self.report is not None:
+            self.report(self.instance, PRIORITY_NAMES[priority_value], wait,
+                        depth)
+        return wait
+
+    def release(self):
+        if self.shared_semaphore is not None:
+            self.shared_semaphore.release()
+        with self.condition:
+            self.running -= 1
+            self.condition.notify_all()
+
+    def pause(self, seconds):
+        """
+        Holds back all queued requests, e.g. after a 429 response.
+        """
+        with self.condition:
+            self.paused_until = max(self.paused_until, time.time() + seconds)
+            self.condition.notify_all()
+
+    def stats(self):
+        with self.condition:
+            stats = {}
+            for value, name in PRIORITY_NAMES.items():
+                count, total_wait = self.waits[value]
+                stats[name] = {
+                    'queued': self.get_queue_depth(value),
+                    'requests': count,
+                    'avg_wait': total_wait / count if count else 0.0}
+            stats['running'] = self.running
+            return stats
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
@@ -0,0 +1,187 @@
+import json
+import struct
+import zlib
+
+
+FORMAT_VERSION = 1
+
+MAGIC = b'YT'
+HEADER = struct.Struct('>2sBB')
+INDEX_SIZE = struct.Struct('>I')
+
+CODECS = {
+    None: (0, lambda data: data, lambda data: data),
+    'zlib': (1, zlib.compress, zlib.decompress)}
+CODEC_IDS = dict((codec_id, (name, decompress))
+                 for name, (codec_id, _, decompress) in CODECS.items())
+
+
+class IncompatibleFormat(ValueError):
+    pass
+
+
+class ProjectField(object):
+    """
+    Compact, read-only replacement for the project field dict returned by
+    `YouTrackClient.get_project_fields`. The field values are decoded on
+    first access only.
+    """
+
+    __slots__ = ('name', 'type', 'empty_text', '_values', '_load_values')
+
+    keys = ('name', 'type', 'empty_text', 'values')
+
+    def __init__(self, name, type, empty_text, values=None, load_values=None):
+        self.name = name
+        self.type = type
+        self.empty_text = empty_text
+        self._values = values
+        self._load_values = load_values
+
+    @property
+    def values(self):
+        if self._load_values is not None:
+            self._values = self._load_values()
+            self._load_values = None
+        return self._values
+
+    def __getitem__(self, key):
+        if key not in self.keys:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def as_dict(self):
+        return dict((key, self[key]) for key in self.keys)
+
+    def __eq__(self, other):
+        if isinstance(other, ProjectField):
+            other = other.as_dict()
+        return self.as_dict() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '<ProjectField: %s>' % self.name
+
+
+class PackedProjectFields(object):
+    """
+    Sequence of `ProjectField` objects backed by a packed payload.
+    """
+
+    def __init__(self, data):
+        if len(data) < HEADER.size:
+            raise IncompatibleFormat('Payload too short')
+        magic, version, codec_id = HEADER.unpack(data[:HEADER.size])
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise IncompatibleFormat('Unsupported format version')
+        if codec_id not in CODEC_IDS:
+            raise IncompatibleFormat('Unknown codec: %s' % codec_id)
+        self.codec = CODEC_IDS[codec_id][0]
+
+        body = CODEC_IDS[codec_id][1](data[HEADER.size:])
+        index_end = INDEX_SIZE.size + INDEX_SIZE.unpack(
+            body[:INDEX_SIZE.size])[0]
+        index = json.loads(body[INDEX_SIZE.size:index_end].decode('utf-8'))
+        self._strings = index['s']
+        self._records = index['f']
+        self._segments = index['o']
+        self._body = body
+        self._offset = index_end
+        self._fields = {}
+
+    def _load_segment(self, segment):
+        start, end = self._segments[segment]
+        start += self._offset
+        end += self._offset
+        return json.loads(self._body[start:end].decode('utf-8'))
+
+    def _get_field(self, position):
+        if position not in self._fields:
+            name, type_, empty_text, segment = self._records[position]
+            load_values = None
+            if segment >= 0:
+                load_values = lambda: self._load_segment(segment)
+            self._fields[position] = ProjectField(
+                self._strings[name], self._strings[type_],
+                self._strings[empty_text], load_values=load_values)
+        return self._fields[position]
+
+    def __len__(self):
+        return len(self._records)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self._get_field(index) for index in
+                    range(*position.indices(len(self)))]
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError(position)
+        return self._get_field(position)
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self._get_field(position)
+
+
+def pack_project_fields(fields, codec='zlib'):
+    """
+    Pack project field dicts into a compact, versioned byte string.
+
+    Field names, types and empty texts are interned into a shared string
+    table and identical value lists (e.g. one user bundle used by several
+    fields) are stored once.
+    """
+    if codec not in CODECS:
+        raise ValueError('Unknown codec: %s' % codec)
+    codec_id, compress, _ = CODECS[codec]
+
+    strings, string_ids = [], {}
+    segments, segment_ids = [], {}
+    records = []
+    chunks, offset = [], 0
+
+    def intern(value):
+        if value not in string_ids:
+            string_ids[value] = len(strings)
+            strings.append(value)
+        return string_ids[value]
+
+    for field in fields:
+        values = field.get('values')
+        segment = -1
+        if values is not None:
+            chunk = json.dumps(list(values), separators=(',', ':'))
+            if chunk not in segment_ids:
+                encoded = chunk.encode('utf-8')
+                segment_ids[chunk] = len(segments)
+                segments.append((offset, offset + len(encoded)))
+                chunks.append(encoded)
+                offset += len(encoded)
+            segment = segment_ids[chunk]
+        records.append([intern(field['name']), intern(field['type']),
+                        intern(field.get('empty_text')), segment])
+
+    index = json.dumps({'s': strings, 'f': records, 'o': segments},
+                       separators=(',', ':')).encode('utf-8')
+    body = INDEX_SIZE.pack(len(index)) + index + b''.join(chunks)
+    return HEADER.pack(MAGIC, FORMAT_VERSION, codec_id) + compress(body)
+
+
+def unpack_project_fields(data):
+    """
+    Return a lazy `PackedProjectFields` sequence or None if the payload
+    was written by an incompatible version of the format.
+    """
+    try:
+        return PackedProjectFields(data)
+    except (IncompatibleFormat, TypeError, struct.error, zlib.error):
+        return None
@@ -0,0 +1,57 @@
+import errno
+import logging
+import os
+import tempfile
+
+
+logger = logging.getLogger(__name__)
+
+_replace = getattr(os, 'replace', os.rename)
+
+
+class MetadataStore(object):
+    """
+    File based second tier for cached YouTrack metadata. It keeps the last
+    known payload of every cache key, so the data survives cache flushes
+    and deploys. Payloads are stored as-is, they must be byte strings.
+    """
+
+    suffix = '.ytmeta'
+
+    def __init__(self, path):
+        self.path = path
+
+    def get_filename(self, key):
+        return os.path.join(self.path, '%s%s' % (key, self.suffix))
+
+    def get(self, key):
+        try:
+            with open(self.get_filename(key), 'rb') as f:
+                return f.read()
+        except (IOError, OSError) as e:
+            if e.errno != errno.ENOENT:
+                logger.warning('Unable to read %s: %s', key, e)
+            return None
+
+    def set(self, key, data):
+        tmp_filename = None
+        try:
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path)
+            fd, tmp_filename = tempfile.mkstemp(dir=self.path)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            _replace(tmp_filename, self.get_filename(key))
+        except (IOError, OSError) as e:
+            logger.warning('Unable to write %s: %s', key, e)
+            if tmp_filename is not None:
+                self._remove(tmp_filename)
+
+    def _remove(self, filename):
+        try:
+            os.remove(filename)
+        except (IOError, OSError):
+            pass
+
+    def delete(self, key):
+        self._remove(self.get_filename(key))
@@ -1,25 +1,97 @@
+import logging
+import threading
 from hashlib import md5
+from importlib import import_module
 
 from sentry.utils.cache import cache
 
+from .profiling import get_trace
+from .scheduler import BACKGROUND, priority
+
+
+logger = logging.getLogger(__name__)
+
+
+def refresh_in_background(key, timeout, func, *args, **kwargs):
+    """
+    Runs `func` in a background thread unless a refresh of the same key is
+    already running somewhere.
+    """
+    if not cache.add('%s:refresh' % key, 1, timeout):
+        return
+
+    def refresh():
+        try:
+            with priority(BACKGROUND):
+                func(*args, **kwargs)
+        except Exception:
+            logger.exception('Unable to refresh %s', key)
+        finally:
+            cache.delete('%s:refresh' % key)
+
+    thread = threading.Thread(target=refresh)
+    thread.daemon = True
+    thread.start()
+
+
+def cache_this(timeout=60, dumps=None, loads=None, store=None):
+    """
+    Caches the result of the decorated function. When a `store` is given,
+    the last known result is also kept there and served on a cache miss
+    while a fresh value is fetched in the background.
+    """
+    if store is not None and dumps is None:
+        raise ValueError('A store requires the dumps function')
 
-def cache_this(timeout=60):
     def decorator(func):
         def wrapper(*args, **kwargs):
             def get_cache_key(*args, **kwargs):
                 params = list(args) + list(kwargs.values())
                 encodestr = "".join(map(str, params))
                 return md5(encodestr.encode()).hexdigest()
+
+            def update():
+                result = func(*args, **kwargs)
+                value = dumps(result) if dumps else result
+                cache.set(key, value, timeout)
+                if store is not None:
+                    store.set(key, value)
+                return result
+
             key = get_cache_key(func.__name__, *args, **kwargs)
             result = cache.get(key)
+            if result is not None and loads is not None:
+                result = loads(result)
+            trace = get_trace()
+            if trace is not None:
+                trace.record_cache(func.__name__, bool(result))
+            if not result and store is not None:
+                stored = store.get(key)
+                if stored is not None:
+                    result = loads(stored) if loads else stored
+                if result:
+                    refresh_in_background(key, timeout, update)
             if not result:
-                result = func(*args, **kwargs)
-                cache.set(key, result, timeout)
+                result = update()
             return result
         return wrapper
     return decorator
 
 
+class LazyImport(object):
+    """
+    Class attribute which imports `name` from `module` on first access, e.g.
+    ``new_issue_form = LazyImport('sentry_youtrack.forms', 'NewIssueForm')``.
+    """
+
+    def __init__(self, module, name):
+        self.module = module
+        self.name = name
+
+    def __get__(self, instance, owner):
+        return getattr(import_module(self.module), self.name)
+
+
 def get_int(value, default=0):
     try:
         return int(value)
@@ -1,13 +1,25 @@
 # -*- encoding: utf-8 -*-
 import requests
 import logging
+import threading
+import time
+import uuid
+from email.utils import mktime_tz, parsedate_tz
 from bs4 import BeautifulSoup
 
 from sentry_youtrack import VERSION
+from sentry_youtrack.conf import youtrack_settings
+from sentry_youtrack.profiling import get_trace, use_trace
+from sentry_youtrack.scheduler import get_priority, priority
 
 
 logger = logging.getLogger(__name__)
 
+# (instance url, project id, field name) -> (bundle name, timestamp)
+_bundle_names = {}
+# (instance url, project id, candidate names) -> (field name, timestamp)
+_field_names = {}
+
 
 class Session(requests.Session):
 
@@ -20,26 +32,257 @@ class YouTrackError(Exception):
     pass
 
 
-class YouTrackClient(object):
+class Prefetch(object):
+    """
+    Runs `func` in a background thread, `result` waits for it to finish.
+    The request priority and the call trace of the calling thread apply.
+    """
+
+    def __init__(self, func, *args):
+        self.value = None
+        self.error = None
+        self.thread = threading.Thread(
+            target=self._run, args=(func, args, get_priority(), get_trace()))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self, func, args, priority_value, call_trace):
+        try:
+            with priority(priority_value), use_trace(call_trace):
+                self.value = func(*args)
+        except Exception as e:
+            self.error = e
+
+    def wait(self):
+        self.thread.join()
+
+    def result(self):
+        self.wait()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class ProjectIssuesIterator(object):
+    """
+    Iterates over all issues of a project, page by page. The next page is
+    fetched in the background while the current one is consumed, so at
+    most two pages are held in memory.
+
+    `offset` always points to the next issue to be yielded and can be
+    stored to resume the iteration later.
+    """
+
+    def __init__(self, client, project_id, query=None, page_size=100,
+                 offset=0, prefetch=True):
+        self.client = client
+        self.project_id = project_id
+        self.query = query
+        self.page_size = page_size
+        self.offset = offset
+        self.prefetch = prefetch
+
+    def _fetch(self, offset):
+        return self.client.get_project_issues(
+            self.project_id, query=self.query, offset=offset,
+            limit=self.page_size)
+
+    def _fetch_page(self, offset):
+        if self.prefetch:
+            return Prefetch(self._fetch, offset)
+        return offset
+
+    def _get_page(self, page):
+        if self.prefetch:
+            return page.result()
+        return self._fetch(page)
+
+    def __iter__(self):
+        page_offset = self.offset
+        page = self._fetch_page(page_offset)
+        try:
+            while page is not None:
+                issues = self._get_page(page)
+                page = None
+                page_offset += len(issues)
+                if len(issues) >= self.page_size:
+                    page = self._fetch_page(page_offset)
+                for issue in issues:
+                    self.offset += 1
+                    yield issue
+        finally:
+            # the page fetched ahead when the caller stopped early, no
+            # request is left running after the iterator is closed
+            if self.prefetch and page is not None:
+                page.wait()
+
+
+class BaseYouTrackClient(object):
+    """
+    Urls and response parsing shared by the blocking and asyncio clients.
+    """
 
     LOGIN_URL = '/rest/user/login'
     PROJECT_URL = '/rest/admin/project/<project_id>'
     PROJECT_FIELDS = '/rest/admin/project/<project_id>/customfield'
+    PROJECT_FIELD = '/rest/admin/project/<project_id>/customfield/<field>'
+    CUSTOM_FIELDS = '/rest/admin/customfield/field'
+    CUSTOM_FIELD = '/rest/admin/customfield/field/<field>'
     PROJECTS_URL = '/rest/project/all'
     CREATE_URL = '/rest/issue'
     ISSUES_URL = '/rest/issue/byproject/<project_id>'
     COMMAND_URL = '/rest/issue/<issue>/execute'
+    ATTACHMENT_URL = '/rest/issue/<issue>/attachment'
     CUSTOM_FIELD_VALUES = '/rest/admin/customfield/<param_name>/<param_value>'
     USER_URL = '/rest/admin/user/<user>'
 
     API_KEY_COOKIE_NAME = 'jetbrains.charisma.main.security.PRINCIPAL'
 
+    BUNDLES = {
+        'enum': 'enumeration',
+        'state': 'stateBundle',
+        'user': 'userBundle',
+        'ownedField': 'ownedFieldBundle',
+        'version': 'versions',
+        'build': 'buildBundle'}
+
+    BUNDLE_NAME_TTL = 3600
+
+    MAX_RETRIES = 2
+    MAX_RETRY_AFTER = 60
+
+    user_agent = 'sentry-youtrack/%s' % VERSION
+
+    def _parse(self, text):
+        trace = get_trace()
+        if trace is None:
+            return BeautifulSoup(text, 'xml')
+        started = time.time()
+        soup = BeautifulSoup(text, 'xml')
+        trace.record_parse(time.time() - started)
+        return soup
+
+    def _get_custom_field_values_url(self, name, value):
+        return self.url + (self.CUSTOM_FIELD_VALUES
+                           .replace("<param_name>", name)
+                           .replace('<param_value>',
+                                    requests.compat.quote(value)))
+
+    def _get_project_field_url(self, field):
+        url = field['url']
+        return '%s%s' % (self.url, url[url.index('/rest/admin/'):])
+
+    def _parse_bundle(self, text):
+        soup = self._parse(text)
+        if soup.find('error'):
+            raise YouTrackError(soup.find('error').string)
+        return soup
+
+    def _get_field_bundle_url(self, field_name, project_id=None):
+        field_name = requests.compat.quote(field_name)
+        if project_id:
+            return self.url + (self.PROJECT_FIELD
+                               .replace('<project_id>', project_id)
+                               .replace('<field>', field_name))
+        return self.url + self.CUSTOM_FIELD.replace('<field>', field_name)
+
+    def _parse_field_bundle_name(self, text):
+        soup = self._parse(text)
+        if soup.find('error'):
+            raise YouTrackError(soup.find('error').string)
+        # project fields keep the bundle in <param name="bundle">, field
+        # prototypes in <defaultParam name="defaultBundle">
+        param = soup.find(['param', 'defaultParam'],
+                          {'name': ['bundle', 'defaultBundle']})
+        if param is None:
+            raise YouTrackError('Bundle not found')
+        return param['value']
+
+    def _get_cached(self, values, key):
+        value, timestamp = values.get((self.url,) + key, (None, 0))
+        if time.time() - timestamp < self.BUNDLE_NAME_TTL:
+            return value
+
+    def _set_cached(self, values, key, value):
+        values[(self.url,) + key] = (value, time.time())
+
+    def _match_field_name(self, names, fields):
+        available = dict((field['name'].lower(), field['name'])
+                         for field in fields)
+        for name in names:
+            if name.lower() in available:
+                return available[name.lower()]
+        raise YouTrackError('Field not found: %s' % ', '.join(names))
+
+    def _get_user_logins(self, xml):
+        return [item['login'] for item in xml.findAll('user')]
+
+    def _get_field_bundle_params(self, field_data):
+        field_type = field_data.projectCustomField['type']
+        type_prefix = field_type[:field_type.find('[')]
+
+        type_name = "%sBundle" % type_prefix
+        if type_prefix == 'enum':
+            type_name = 'bundle'
+
+        if field_data.param:
+            return {
+                'name': type_name,
+                'value': field_data.param['value'],
+                'bundle': self.BUNDLES.get(type_prefix)}
+
+    def _get_field_details(self, field_data, values):
+        return {
+            'name': field_data.projectCustomField['name'],
+            'type': field_data.projectCustomField['type'],
+            'empty_text': field_data.projectCustomField['emptyText'],
+            'values': values}
+
+    def _parse_projects(self, text):
+        for project in self._parse(text).projectShorts:
+            yield {'id': project['shortName'], 'name': project['name']}
+
+    def _parse_issues(self, text):
+        return [
+            {'id': issue['id'],
+             'state': issue.find("field", {'name': 'State'}).value.text,
+             'summary': issue.find("field", {'name': 'summary'}).text}
+            for issue in self._parse(text).issues]
+
+    def _get_retry_after(self, response):
+        value = response.headers.get('Retry-After', '')
+        try:
+            delay = float(value)
+        except ValueError:
+            date = parsedate_tz(value)
+            delay = mktime_tz(date) - time.time() if date else 1
+        return min(max(delay, 0), self.MAX_RETRY_AFTER)
+
+    def _parse_project_fields_list(self, text):
+        for field in self._parse(text).projectCustomFieldRefs:
+            yield {'name': field['name'], 'url': field['url']}
+
+    def _parse_custom_fields_list(self, text):
+        for field in self._parse(text).find_all('customFieldPrototype'):
+            yield {'name': field['name'], 'url': field.get('url')}
+
+
+class YouTrackClient(BaseYouTrackClient):
+
     def __init__(self, url, username=None, password=None, api_key=None,
-                 verify_ssl_certificate=True):
+                 verify_ssl_certificate=True, session=None, limiter=None,
+                 max_retries=BaseYouTrackClient.MAX_RETRIES,
+                 on_session_expired=None):
         self.verify_ssl_certificate = verify_ssl_certificate
         self.url = url.rstrip('/') if url else ''
+        self.session = session or Session()
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.on_session_expired = on_session_expired
+        self.credentials = None
         if api_key is None:
             self.api_key = self._login(username, password)
+            self.credentials = (username, password)
         else:
             self.api_key = api_key
         self.cookies = {self.API_KEY_COOKIE_NAME: self.api_key}
@@ -50,14 +293,27 @@ class YouTrackClient(object):
             'password': password}
         url = self.url + self.LOGIN_URL
         response = self.request(url, data=credentials, method='post')
-        if BeautifulSoup(response.text, 'xml').login is None:
+        if self._parse(response.text).login is None:
             raise requests.HTTPError('Invalid YouTrack url')
         return response.cookies.get(self.API_KEY_COOKIE_NAME)
 
+    def _renew_session(self, url):
+        """
+        Logs in again after YouTrack dropped the session, e.g. when it was
+        restarted. `on_session_expired(client)` may provide a new client to
+        take the session from. Returns False if there are no credentials.
+        """
+        if self.credentials is None or url == self.url + self.LOGIN_URL:
+            return False
+        if self.on_session_expired is not None:
+            self.api_key = self.on_session_expired(self).api_key
+        else:
+            self.api_key = self._login(*self.credentials)
+        self.cookies = {self.API_KEY_COOKIE_NAME: self.api_key}
+        return True
+
     def _get_bundle(self, response, bundle='enumeration'):
-        soup = BeautifulSoup(response.text, 'xml')
-        if soup.find('error'):
-            raise YouTrackError(soup.find('error').string)
+        soup = self._parse_bundle(response.text)
 
         bundle_method = '_get_%s_values' % bundle.lower()
         if hasattr(self, bundle_method):
@@ -66,62 +322,35 @@ class YouTrackClient(object):
         return [item.text for item in getattr(soup, bundle)]
 
     def _get_userbundle_values(self, soup):
-        def get_user_logins(xml):
-            return [item['login'] for item in xml.findAll('user')]
-        users = set(get_user_logins(soup.userBundle))
+        users = set(self._get_user_logins(soup.userBundle))
         for group in soup.userBundle.findAll('userGroup'):
-            users.update(
-                get_user_logins(self._get_users_from_group(group['name'])))
+            users.update(self._get_user_logins(
+                self._get_users_from_group(group['name'])))
         return sorted(users)
 
     def _get_users_from_group(self, group):
         url = self.url + self.USER_URL.replace('/<user>', '')
         response = self.request(url, method='get', params={'group': group})
-        return BeautifulSoup(response.text, 'xml').userRefs
+        return self._parse(response.text).userRefs
 
     def _get_custom_field_values(self, name, value, bundle='enumeration'):
-        url = self.url + (self.CUSTOM_FIELD_VALUES
-                          .replace("<param_name>", name)
-                          .replace('<param_value>', requests.compat.quote(value)))
+        url = self._get_custom_field_values_url(name, value)
         response = self.request(url, method='get')
         return self._get_bundle(response, bundle)
 
     def _get_custom_project_field_details(self, field):
-        url = field['url']
-        url = '%s%s' % (self.url, url[url.index('/rest/admin/'):])
+        url = self._get_project_field_url(field)
         response = self.request(url, method='get')
-        field_data = BeautifulSoup(response.text, 'xml')
-        field_type = field_data.projectCustomField['type']
-        type_prefix = field_type[:field_type.find('[')]
-
-        type_name = "%sBundle" % type_prefix
-        if type_prefix == 'enum':
-            type_name = 'bundle'
-
-        bundles = {
-            'enum': 'enumeration',
-            'state': 'stateBundle',
-            'user': 'userBundle',
-            'ownedField': 'ownedFieldBundle',
-            'version': 'versions',
-            'build': 'buildBundle'}
+        field_data = self._parse(response.text)
 
         values = None
-        if field_data.param:
-            kwargs = {
-                'name': type_name,
-                'value': field_data.param['value'],
-                'bundle': bundles.get(type_prefix)}
+        kwargs = self._get_field_bundle_params(field_data)
+        if kwargs:
             values = self._get_custom_field_values(**kwargs)
+        return self._get_field_details(field_data, values)
 
-        field_details = {
-            'name': field_data.projectCustomField['name'],
-            'type': field_data.projectCustomField['type'],
-            'empty_text': field_data.projectCustomField['emptyText'],
-            'values': values}
-        return field_details
-
-    def request(self, url, data=None, params=None, method='get'):
+    def request(self, url, data=None, params=None, method='get',
+                headers=None):
         if method not in ['get', 'post']:
             raise AttributeError("Invalid method %s" % method)
 
@@ -131,70 +360,178 @@ class YouTrackClient(object):
             'params': params,
             'verify': self.verify_ssl_certificate,
             'headers': {
-                'User-Agent': 'sentry-youtrack/%s' % VERSION}}
+                'User-Agent': self.user_agent}}
+        if headers:
+            kwargs['headers'].update(headers)
 
         if hasattr(self, 'cookies'):
             kwargs['cookies'] = self.cookies
 
-        session = Session()
-        if method == 'get':
-            response = session.get(**kwargs)
-        else:
-            response = session.post(**kwargs)
+        # streamed bodies can't be sent twice
+        resendable = data is None or isinstance(
+            data, (dict, list, tuple, bytes, type(u'')))
+        max_retries = self.max_retries if resendable else 0
+
+        started = time.time()
+        queued = duration = 0.0
+        attempt = 0
+        renewed = False
+        while True:
+            waited = time.time()
+            if self.limiter is not None:
+                with self.limiter:
+                    sent = time.time()
+                    response = self._send(method, kwargs)
+            else:
+                sent = waited
+                response = self._send(method, kwargs)
+            queued += sent - waited
+            duration += time.time() - sent
+            if (response.status_code == 401 and resendable and
+                    not renewed and self._renew_session(url)):
+                renewed = True
+                kwargs['cookies'] = self.cookies
+                continue
+            if response.status_code != 429 or attempt == max_retries:
+                break
+            attempt += 1
+            waited = time.time()
+            self._wait_for_retry(response)
+            queued += time.time() - waited
+
+        trace = get_trace()
+        if trace is not None:
+            trace.record_request(
+                method, url, started, duration, len(response.content),
+                response.status_code, queued=queued)
         response.raise_for_status()
         return response
 
+    def _wait_for_retry(self, response):
+        delay = self._get_retry_after(response)
+        logger.warning('YouTrack rate limit exceeded, retrying in %ss', delay)
+        if hasattr(self.limiter, 'pause'):
+            self.limiter.pause(delay)
+        else:
+            time.sleep(delay)
+
+    def _send(self, method, kwargs):
+        if method == 'get':
+            return self.session.get(**kwargs)
+        return self.session.post(**kwargs)
+
     def get_project_name(self, project_id):
         url = self.url + self.PROJECT_URL.replace('<project_id>', project_id)
         response = self.request(url, method='get')
-        return BeautifulSoup(response.text, 'xml').project['name']
+        return self._parse(response.text).project['name']
 
     def get_user(self, username):
         url = self.url + self.USER_URL.replace('<user>', username)
         response = self.request(url, method='get')
-        return BeautifulSoup(response.text, 'xml').user
+        return self._parse(response.text).user
 
     def get_projects(self):
         url = self.url + self.PROJECTS_URL
         response = self.request(url, method='get')
-        data = BeautifulSoup(response.text, 'xml')
-        for project in data.projectShorts:
-            yield {'id': project['shortName'], 'name': project['name']}
-
-    def get_priorities(self):
-        try:
-            return self._get_custom_field_values('bundle', 'Priorities')
-        except:
-            return self._get_custom_field_values('bundle', 'Приоритеты')
-
-    def get_issue_types(self):
-        try:
-            return self._get_custom_field_values('bundle', 'Types')
-        except:
-            return self._get_custom_field_values('bundle', 'Типы')
-
+        return self._parse_projects(response.text)
+
+    def get_field_bundle_name(self, field_name, project_id=None):
+        bundle_name = self._get_cached(_bundle_names, (project_id, field_name))
+        if bundle_name is None:
+            url = self._get_field_bundle_url(field_name, project_id)
+            response = self.request(url, method='get')
+            bundle_name = self._parse_field_bundle_name(response.text)
+            self._set_cached(
+                _bundle_names, (project_id, field_name), bundle_name)
+        return bundle_name
+
+    def find_field_bundle_name(self, names, project_id=None):
+        """
+        Returns the bundle of the first field from `names` which the project
+        has, or which exists on the instance when no project is given. Names
+        are matched case-insensitively against a single listing of fields.
+        """
+        key = (project_id, tuple(names))
+        field_name = self._get_cached(_field_names, key)
+        if field_name is None:
+            if project_id:
+                fields = self.get_project_fields_list(project_id)
+            else:
+                fields = self.get_custom_fields_list()
+            field_name = self._match_field_name(names, fields)
+            self._set_cached(_field_names, key, field_name)
+        return self.get_field_bundle_name(field_name, project_id)
+
+    def get_priorities(self, project_id=None):
+        bundle_name = self.find_field_bundle_name(
+            youtrack_settings.PRIORITY_FIELDS, project_id)
+        return self._get_custom_field_values('bundle', bundle_name)
+
+    def get_issue_types(self, project_id=None):
+        bundle_name = self.find_field_bundle_name(
+            youtrack_settings.TYPE_FIELDS, project_id)
+        return self._get_custom_field_values('bundle', bundle_name)
 
     def get_project_issues(self, project_id, query=None, offset=0, limit=15):
         url = self.url + self.ISSUES_URL.replace('<project_id>', project_id)
         params = {'max': limit, 'after': offset, 'filter': query}
         response = self.request(url, method='get', params=params)
-        issues = [
-            {'id': issue['id'],
-             'state': issue.find("field", {'name': 'State'}).value.text,
-             'summary': issue.find("field", {'name': 'summary'}).text}
-            for issue in BeautifulSoup(response.text, 'xml').issues]
-        return issues
-
-    def create_issue(self, data):
+        return self._parse_issues(response.text)
+
+    def iter_project_issues(self, project_id, query=None, page_size=100,
+                            offset=0, prefetch=True):
+        return ProjectIssuesIterator(self, project_id, query=query,
+                                     page_size=page_size, offset=offset,
+                                     prefetch=prefetch)
+
+    def create_issue(self, data, key=None):
+        """
+        Creates an issue and returns its id. `key` is a unique word of the
+        issue text: when the request is lost after it was sent, the issue
+        YouTrack may have created in the meantime is looked up by it
+        instead of being created again.
+        """
         url = self.url + self.CREATE_URL
-        response = self.request(url, data=data, method='post')
-        return BeautifulSoup(response.text, 'xml').issue['id']
+        try:
+            response = self.request(url, data=data, method='post')
+        except (requests.ConnectionError, requests.Timeout):
+            if key is None:
+                raise
+            issues = self.get_project_issues(
+                data['project'], query=key, limit=1)
+            if issues:
+                return issues[0]['id']
+            response = self.request(url, data=data, method='post')
+        return self._parse(response.text).issue['id']
 
     def execute_command(self, issue, command):
         url = self.url + self.COMMAND_URL.replace('<issue>', issue)
         data = {'command': command}
         return self.request(url, data=data, method='post')
 
+    def add_attachment(self, issue, filename, chunks,
+                       content_type='application/octet-stream'):
+        """
+        Uploads an attachment streamed from the `chunks` iterator as a
+        chunked multipart request.
+        """
+        url = self.url + self.ATTACHMENT_URL.replace('<issue>', issue)
+        boundary = uuid.uuid4().hex
+
+        def body():
+            yield ('--%s\r\n'
+                   'Content-Disposition: form-data; name="file"; '
+                   'filename="%s"\r\n'
+                   'Content-Type: %s\r\n\r\n' % (
+                       boundary, filename, content_type)).encode('utf-8')
+            for chunk in chunks:
+                yield chunk
+            yield ('\r\n--%s--\r\n' % boundary).encode('utf-8')
+
+        headers = {
+            'Content-Type': 'multipart/form-data; boundary=%s' % boundary}
+        return self.request(url, data=body(), method='post', headers=headers)
+
     def add_tags(self, issue, tags):
         for tag in tags:
             cmd = 'add tag %s' % tag
@@ -203,8 +540,12 @@ class YouTrackClient(object):
     def get_project_fields_list(self, project_id):
         url = self.url + self.PROJECT_FIELDS.replace('<project_id>', project_id)
         response = self.request(url, method='get')
-        for field in BeautifulSoup(response.text, 'xml').projectCustomFieldRefs:
-            yield {'name': field['name'], 'url': field['url']}
+        return self._parse_project_fields_list(response.text)
+
+    def get_custom_fields_list(self):
+        url = self.url + self.CUSTOM_FIELDS
+        response = self.request(url, method='get')
+        return self._parse_custom_fields_list(response.text)
 
     def get_project_fields(self, project_id, ignore_fields=None):
         ignore_fields = ignore_fields or []
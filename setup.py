@@ -42,6 +42,9 @@ setup(
         'soupsieve==1.9.6',
         'beautifulsoup4',
     ],
+    extras_require={
+        'async': ['aiohttp'],
+    },
     include_package_data=True,
     zip_safe=False,
     entry_points={
@@ -68,5 +71,6 @@ setup(
         'pytest',
         'vcrpy',
         'sentry>=9.1.0',
+        'aiohttp; python_version >= "3.6"',
     ]
 )
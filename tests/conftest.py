@@ -0,0 +1,43 @@
+import importlib
+import sys
+
+import pytest
+
+from .fakes import FakeCache, get_sentry_modules
+
+
+# the asyncio client and its tests are Python 3 only
+collect_ignore = []
+if sys.version_info < (3, 6):
+    collect_ignore.append('test_aio.py')
+
+
+@pytest.fixture
+def cache():
+    return FakeCache()
+
+
+def import_module(monkeypatch, name):
+    """
+    Imports `name`, against stubbed Sentry modules when Sentry isn't
+    installed.
+    """
+    try:
+        import sentry  # noqa
+    except ImportError:
+        for module_name, module in get_sentry_modules().items():
+            monkeypatch.setitem(sys.modules, module_name, module)
+        # imported again, and dropped after the test
+        monkeypatch.setitem(sys.modules, name, None)
+        del sys.modules[name]
+    return importlib.import_module(name)
+
+
+@pytest.fixture
+def plugin_module(monkeypatch):
+    return import_module(monkeypatch, 'sentry_youtrack.plugin')
+
+
+@pytest.fixture
+def utils_module(monkeypatch):
+    return import_module(monkeypatch, 'sentry_youtrack.utils')
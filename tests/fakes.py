@@ -0,0 +1,135 @@
+"""
+Test doubles shared by the test modules, including stand-ins for the
+Sentry modules imported by `sentry_youtrack.plugin` for test runs
+without Sentry installed.
+"""
+import sys
+import threading
+import types
+
+
+class FakeCache(object):
+    """In-memory stand-in for `sentry.utils.cache.cache`."""
+
+    def __init__(self):
+        self.data = {}
+        self.timeouts = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, timeout=None):
+        with self.lock:
+            self.data[key] = value
+            self.timeouts[key] = timeout
+
+    def add(self, key, value, timeout=None):
+        with self.lock:
+            if key in self.data:
+                return False
+            self.data[key] = value
+            self.timeouts[key] = timeout
+            return True
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+            self.timeouts.pop(key, None)
+
+
+class PluginError(Exception):
+    pass
+
+
+class IntegrationFeatures(object):
+    ISSUE_BASIC = 'issue-basic'
+
+
+class FeatureDescription(object):
+
+    def __init__(self, description, *features):
+        self.description = description
+        self.features = features
+
+
+class CorePluginMixin(object):
+    pass
+
+
+class IssuePlugin(object):
+
+    def get_conf_key(self):
+        return self.conf_key
+
+    def get_option(self, key, project=None, user=None):
+        return None
+
+    def set_option(self, key, value, project=None, user=None):
+        pass
+
+    def reset_options(self, project=None, user=None):
+        pass
+
+    def validate_config(self, project, config, actor=None):
+        return config
+
+    def view(self, request, group, **kwargs):
+        return None
+
+    def render(self, template, context=None):
+        return template, context
+
+
+class GroupMetaManager(object):
+
+    def populate_cache(self, instance_list):
+        pass
+
+    def get_value(self, instance, key, default=None):
+        return default
+
+    def set_value(self, instance, key, value):
+        pass
+
+
+class GroupMeta(object):
+    objects = GroupMetaManager()
+
+
+class ProjectOption(object):
+    objects = None
+
+
+def metric(*args, **kwargs):
+    pass
+
+
+def get_module(name, **attrs):
+    module = types.ModuleType(name)
+    module.__dict__.update(attrs)
+    return module
+
+
+def get_sentry_modules():
+    return dict((module.__name__, module) for module in [
+        get_module('sentry'),
+        get_module('sentry.exceptions', PluginError=PluginError),
+        get_module('sentry.integrations',
+                   FeatureDescription=FeatureDescription,
+                   IntegrationFeatures=IntegrationFeatures),
+        get_module('sentry.models', GroupMeta=GroupMeta,
+                   ProjectOption=ProjectOption),
+        get_module('sentry.plugins'),
+        get_module('sentry.plugins.bases'),
+        get_module('sentry.plugins.bases.issue', IssuePlugin=IssuePlugin),
+        get_module('sentry.utils'),
+        get_module('sentry.utils.cache', cache=FakeCache()),
+        get_module('sentry.utils.metrics', gauge=metric, incr=metric,
+                   timing=metric),
+        get_module('sentry_plugins'),
+        get_module('sentry_plugins.base', CorePluginMixin=CorePluginMixin)])
+
+
+def install_sentry_stubs():
+    sys.modules.update(get_sentry_modules())
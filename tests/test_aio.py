@@ -0,0 +1,63 @@
+import asyncio
+import os
+import sys
+
+import pytest
+from vcr import VCR
+
+from sentry_youtrack.aio import AsyncYouTrackClient, SyncYouTrackClient
+from sentry_youtrack.scheduler import BACKGROUND, RequestScheduler
+
+
+PROJECT_ID = 'myproject'
+
+vcr = VCR(path_transformer=VCR.ensure_suffix('.yaml'),
+          cassette_library_dir=os.path.join('tests', 'cassettes'))
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7), reason='requires Python 3.7')
+def test_async_iter_project_issues_cancels_prefetch():
+    class Client(AsyncYouTrackClient):
+
+        async def get_project_issues(self, project_id, query=None, offset=0,
+                                     limit=15):
+            if offset:
+                # the page fetched ahead never arrives
+                await asyncio.Event().wait()
+            return [{'id': 'myproject-%s' % (index + 1)}
+                    for index in range(limit)]
+
+    async def iterate():
+        client = Client('https://youtrack.myjetbrains.com')
+        issues = client.iter_project_issues(PROJECT_ID, page_size=2)
+        await issues.__anext__()
+        await issues.aclose()
+        await asyncio.sleep(0)
+        current = asyncio.current_task()
+        return [task for task in asyncio.all_tasks()
+                if task is not current and not task.done()]
+
+    loop = asyncio.new_event_loop()
+    try:
+        assert loop.run_until_complete(iterate()) == []
+    finally:
+        loop.close()
+
+
+@vcr.use_cassette('test_retry_rate_limited_request.yaml')
+def test_async_client_is_scheduled():
+    scheduler = RequestScheduler(
+        'https://youtrack.myjetbrains.com', 1, report=None)
+    client = SyncYouTrackClient('https://youtrack.myjetbrains.com',
+                                api_key='abcd1234', limiter=scheduler,
+                                priority=BACKGROUND)
+    try:
+        projects = [{'id': 'myproject', 'name': 'My project'}]
+        assert list(client.get_projects()) == projects
+    finally:
+        client.close()
+    stats = scheduler.stats()
+    # the rate limited request and its retry
+    assert stats['background']['requests'] == 2
+    assert stats['interactive']['requests'] == 0
+    assert stats['running'] == 0
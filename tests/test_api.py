@@ -1,9 +1,15 @@
 import os
+import sys
+import time
 
 import pytest
+from requests import HTTPError
+from requests.exceptions import ReadTimeout
 from vcr import VCR
 
-from sentry_youtrack.youtrack import YouTrackClient
+from sentry_youtrack import youtrack
+from sentry_youtrack.profiling import trace
+from sentry_youtrack.youtrack import YouTrackClient, YouTrackError
 
 
 PROJECT_ID = 'myproject'
@@ -12,12 +18,27 @@ vcr = VCR(path_transformer=VCR.ensure_suffix('.yaml'),
           cassette_library_dir=os.path.join('tests', 'cassettes'))
 
 
-@pytest.fixture
-def youtrack_client():
+@pytest.fixture(autouse=True)
+def clear_field_caches():
+    # field and bundle names are kept per process
+    youtrack._bundle_names.clear()
+    youtrack._field_names.clear()
+
+
+@pytest.fixture(params=['sync', 'async'])
+def youtrack_client(request):
+    client_class = YouTrackClient
+    if request.param == 'async':
+        if sys.version_info < (3, 6):
+            pytest.skip('asyncio client requires Python 3.6+')
+        from sentry_youtrack.aio import SyncYouTrackClient
+        client_class = SyncYouTrackClient
     with vcr.use_cassette('youtrack_client.yaml'):
-        client = YouTrackClient('https://youtrack.myjetbrains.com',
-                                username='root', password='admin')
-    return client
+        client = client_class('https://youtrack.myjetbrains.com',
+                              username='root', password='admin')
+    yield client
+    if request.param == 'async':
+        client.close()
 
 
 @vcr.use_cassette
@@ -93,3 +114,191 @@ def test_get_project_fields(youtrack_client):
          'empty_text': 'Next Build', 
          'type': 'build[1]'}]
     assert list(youtrack_client.get_project_fields(PROJECT_ID)) == fields
+
+
+@vcr.use_cassette
+def test_iter_project_issues(youtrack_client):
+    issues = youtrack_client.iter_project_issues(PROJECT_ID, page_size=2)
+    assert [issue['id'] for issue in issues] == [
+        'myproject-1', 'myproject-2', 'myproject-3']
+
+
+@vcr.use_cassette('test_iter_project_issues.yaml')
+def test_iter_project_issues_from_offset(youtrack_client):
+    issues = youtrack_client.iter_project_issues(
+        PROJECT_ID, page_size=2, offset=2)
+    assert list(issues) == [
+        {'id': 'myproject-3', 'state': 'Fixed', 'summary': 'Third issue'}]
+
+
+@vcr.use_cassette('test_iter_project_issues.yaml')
+def test_iter_project_issues_stopped_early(youtrack_client):
+    issues = iter(youtrack_client.iter_project_issues(
+        PROJECT_ID, page_size=2))
+    assert next(issues)['id'] == 'myproject-1'
+    issues.close()
+
+
+def test_iter_project_issues_waits_for_prefetch():
+    fetched = []
+
+    class Client(YouTrackClient):
+
+        def get_project_issues(self, project_id, query=None, offset=0,
+                               limit=15):
+            if offset:
+                time.sleep(0.05)
+                fetched.append(offset)
+            return [{'id': 'myproject-%s' % (offset + index + 1)}
+                    for index in range(limit)]
+
+    client = Client('https://youtrack.myjetbrains.com', api_key='abcd1234')
+    issues = iter(client.iter_project_issues(PROJECT_ID, page_size=2))
+    assert next(issues)['id'] == 'myproject-1'
+    issues.close()
+    # the page fetched ahead is done, nothing runs after the close
+    assert fetched == [2]
+
+
+@vcr.use_cassette('test_iter_project_issues.yaml')
+def test_prefetched_requests_are_traced():
+    client = YouTrackClient('https://youtrack.myjetbrains.com',
+                            api_key='abcd1234')
+    with trace() as call_trace:
+        issues = list(client.iter_project_issues(PROJECT_ID, page_size=2))
+    assert len(issues) == 3
+    assert [call['kind'] for call in call_trace.calls] == [
+        'request', 'request']
+
+
+@vcr.use_cassette
+def test_http_errors(youtrack_client):
+    with pytest.raises(HTTPError) as excinfo:
+        youtrack_client.get_project_name('unknown')
+    assert excinfo.value.response.status_code == 404
+
+
+@vcr.use_cassette('test_get_project_fields.yaml')
+def test_get_priorities_for_project(youtrack_client):
+    priorities = ['Show-stopper', 'Critical', 'Major', 'Normal', 'Minor']
+    assert youtrack_client.get_priorities(PROJECT_ID) == priorities
+
+
+@vcr.use_cassette('test_get_project_fields.yaml')
+def test_project_field_names_are_matched(youtrack_client, settings):
+    settings.YOUTRACK_PRIORITY_FIELDS = ['Severity', 'priority']
+    priorities = ['Show-stopper', 'Critical', 'Major', 'Normal', 'Minor']
+    assert youtrack_client.get_priorities(PROJECT_ID) == priorities
+
+
+@vcr.use_cassette('test_get_project_fields.yaml')
+def test_missing_project_field(youtrack_client, settings):
+    settings.YOUTRACK_TYPE_FIELDS = ['Kind']
+    with pytest.raises(YouTrackError):
+        youtrack_client.get_issue_types(PROJECT_ID)
+
+
+def test_find_field_bundle_name(youtrack_client):
+    with vcr.use_cassette('test_find_field_bundle_name.yaml') as cassette:
+        bundle_name = youtrack_client.find_field_bundle_name(
+            ['Severity', 'PRIORITY'])
+    assert bundle_name == 'Priorities'
+    # the listing and the matching field, nothing is tried one by one
+    assert cassette.play_count == 2
+
+
+def test_missing_field(youtrack_client):
+    with vcr.use_cassette('test_find_field_bundle_name.yaml') as cassette:
+        with pytest.raises(YouTrackError):
+            youtrack_client.find_field_bundle_name([u'Schweregrad'])
+    assert cassette.play_count == 1
+
+
+@vcr.use_cassette
+def test_retry_rate_limited_request():
+    client = YouTrackClient('https://youtrack.myjetbrains.com',
+                            api_key='abcd1234')
+    projects = [{'id': 'myproject', 'name': 'My project'}]
+    assert list(client.get_projects()) == projects
+
+
+class FakeResponse(object):
+    status_code = 200
+    content = b''
+
+    def raise_for_status(self):
+        pass
+
+
+class FakeSession(object):
+
+    def post(self, **kwargs):
+        self.headers = kwargs['headers']
+        self.body = b''.join(kwargs['data'])
+        return FakeResponse()
+
+
+def test_add_attachment():
+    session = FakeSession()
+    client = YouTrackClient('https://youtrack.myjetbrains.com',
+                            api_key='abcd1234', session=session)
+    client.add_attachment('myproject-1', 'event.json.gz',
+                          iter([b'first', b'second']),
+                          content_type='application/gzip')
+    content_type = session.headers['Content-Type']
+    boundary = content_type.split('boundary=')[1].encode('utf-8')
+    assert content_type.startswith('multipart/form-data')
+    assert session.body.startswith(b'--' + boundary)
+    assert b'filename="event.json.gz"' in session.body
+    assert b'Content-Type: application/gzip\r\n\r\nfirstsecond\r\n' in session.body
+    assert session.body.endswith(b'--' + boundary + b'--\r\n')
+
+
+class IssueResponse(FakeResponse):
+
+    def __init__(self, text):
+        self.text = text
+        self.content = text.encode('utf-8')
+
+
+class LostRequestSession(object):
+    """The issue is created, but the response never arrives."""
+
+    def __init__(self, found):
+        self.found = found
+        self.posts = 0
+        self.queries = []
+
+    def post(self, **kwargs):
+        self.posts += 1
+        if self.posts == 1:
+            raise ReadTimeout()
+        return IssueResponse('<issue id="myproject-2"/>')
+
+    def get(self, **kwargs):
+        self.queries.append(kwargs['params']['filter'])
+        issues = ''
+        if self.found:
+            issues = ('<issue id="myproject-1"><field name="summary"><value>'
+                      'Error</value></field><field name="State"><value>Open'
+                      '</value></field></issue>')
+        return IssueResponse('<issues>%s</issues>' % issues)
+
+
+@pytest.mark.parametrize('found, issue_id, posts', [
+    (True, 'myproject-1', 1), (False, 'myproject-2', 2)])
+def test_create_issue_after_lost_request(found, issue_id, posts):
+    session = LostRequestSession(found)
+    client = YouTrackClient('https://youtrack.myjetbrains.com',
+                            api_key='abcd1234', session=session)
+    data = {'project': PROJECT_ID, 'summary': 'Error',
+            'description': 'Sentry issue key: abc'}
+    assert client.create_issue(data, key='abc') == issue_id
+    assert session.queries == ['abc']
+    assert session.posts == posts
+
+    session = LostRequestSession(found)
+    client.session = session
+    with pytest.raises(ReadTimeout):
+        client.create_issue(data)
+    assert session.queries == []
@@ -0,0 +1,64 @@
+# -*- encoding: utf-8 -*-
+import json
+import zlib
+from datetime import datetime
+
+from sentry_youtrack.description import (
+    TRUNCATED, get_size, iter_event_payload, iter_gzip, truncate_description)
+
+
+def get_stacktrace(frames):
+    lines = ['Stacktrace (most recent call last):', '']
+    for index in range(frames):
+        lines.append('  File "app/module%s.py", line %s, in func%s' % (
+            index, index, index))
+        lines.append('    call_next(%s)' % index)
+    return '\n'.join(lines)
+
+
+def test_short_description_is_unchanged():
+    description = get_stacktrace(3)
+    assert truncate_description(description, 1024) == description
+    assert truncate_description('', 10) == ''
+
+
+def test_frames_are_elided_from_the_middle():
+    description = get_stacktrace(100)
+    truncated = truncate_description(description, 2048)
+    assert get_size(truncated) <= 2048
+    assert 'module0.py' in truncated
+    assert 'module99.py' in truncated
+    assert 'module50.py' not in truncated
+    assert '  ... 85 frames elided ...' in truncated
+    assert 'call_next(99)' in truncated
+
+
+def test_more_frames_are_elided_when_needed():
+    description = '\n'.join(['Header', get_stacktrace(100), 'Footer'])
+    truncated = truncate_description(description, 400)
+    assert get_size(truncated) <= 400
+    assert truncated.startswith('Header')
+    assert truncated.endswith('Footer')
+    assert 'module99.py' in truncated
+
+
+def test_description_is_cut_at_byte_budget():
+    description = u'ż\xf3łw' * 1000
+    truncated = truncate_description(description, 101)
+    assert get_size(truncated) <= 101
+    assert truncated.endswith(TRUNCATED)
+
+
+def test_budget_smaller_than_marker():
+    truncated = truncate_description(u'\xe9' * 100, 3)
+    assert get_size(truncated) <= 3
+    assert truncate_description(u'\xe9' * 100, 0) == ''
+
+
+def test_gzip_event_payload():
+    data = {'event_id': 'abc', 'extra': {'values': list(range(1000))},
+            'timestamp': datetime(2020, 1, 1)}
+    chunks = list(iter_gzip(iter_event_payload(data), buffer_size=16))
+    payload = zlib.decompress(b''.join(chunks), 16 + zlib.MAX_WBITS)
+    assert json.loads(payload.decode('utf-8')) == dict(
+        data, timestamp='2020-01-01T00:00:00')
@@ -0,0 +1,56 @@
+from sentry_youtrack.fingerprint import get_fingerprint, get_fingerprint_key
+
+
+def get_event_data(exc_type='ValueError', value='invalid', lineno=10,
+                   path='/srv/app/releases/1'):
+    frames = [
+        {'module': 'django.core.handlers', 'function': 'get_response',
+         'filename': 'django/core/handlers/base.py', 'lineno': 100,
+         'in_app': False},
+        {'module': 'app.views', 'function': 'index',
+         'abs_path': '%s/app/views.py' % path, 'lineno': lineno,
+         'in_app': True},
+        {'module': 'app.utils', 'function': 'parse',
+         'abs_path': '%s/app/utils.py' % path, 'lineno': lineno + 5,
+         'in_app': True}]
+    return {'exception': {'values': [
+        {'type': exc_type, 'value': value,
+         'stacktrace': {'frames': frames}}]}}
+
+
+def test_fingerprint_ignores_volatile_details():
+    fingerprint = get_fingerprint(get_event_data())
+    assert fingerprint
+    assert fingerprint == get_fingerprint(get_event_data(
+        value='other message', lineno=20, path='/srv/app/releases/2'))
+
+
+def test_fingerprint_depends_on_type_and_in_app_frames():
+    fingerprint = get_fingerprint(get_event_data())
+    assert fingerprint != get_fingerprint(get_event_data(exc_type='KeyError'))
+
+    data = get_event_data()
+    data['exception']['values'][0]['stacktrace']['frames'][-1][
+        'function'] = 'load'
+    assert fingerprint != get_fingerprint(data)
+
+    data = get_event_data()
+    data['exception']['values'][0]['stacktrace']['frames'][0][
+        'function'] = 'dispatch'
+    assert fingerprint == get_fingerprint(data)
+
+
+def test_fingerprint_of_legacy_event_data():
+    data = get_event_data()
+    legacy_data = {'sentry.interfaces.Exception': data['exception']}
+    assert get_fingerprint(legacy_data) == get_fingerprint(data)
+
+
+def test_no_fingerprint_without_exception():
+    assert get_fingerprint({'message': 'Something happened'}) is None
+    assert get_fingerprint({'exception': {'values': []}}) is None
+
+
+def test_fingerprint_key():
+    assert get_fingerprint_key(1, 'abc') == 'youtrack:fingerprint:1:abc'
+    assert get_fingerprint_key(1, 'abc') != get_fingerprint_key(2, 'abc')
@@ -0,0 +1,117 @@
+import pytest
+from requests import Response
+from requests.exceptions import ConnectionError, HTTPError, SSLError
+
+from sentry_youtrack.health import (
+    check_instance, get_health, get_health_key, probe, warm_up)
+
+
+URL = 'https://youtrack.myjetbrains.com'
+
+
+def get_error(status_code):
+    response = Response()
+    response.status_code = status_code
+    return HTTPError(response=response)
+
+
+class FakeClient(object):
+
+    def __init__(self, error=None):
+        self.error = error
+        self.users = []
+
+    def get_user(self, username):
+        self.users.append(username)
+        if self.error is not None:
+            raise self.error
+
+
+class FakeRegistry(object):
+
+    def __init__(self, login_error=None, error=None):
+        self.login_error = login_error
+        self.client = FakeClient(error)
+        self.urls = []
+
+    def get_client(self, url, username=None, password=None,
+                   verify_ssl_certificate=True):
+        self.urls.append(url)
+        if self.login_error is not None:
+            raise self.login_error
+        return self.client
+
+
+def test_healthy_instance():
+    registry = FakeRegistry()
+    record = check_instance(URL + '/', 'root', 'admin', registry=registry)
+    assert record['url'] == URL
+    assert record['auth_ok'] and record['tls_ok']
+    assert record['error'] is None
+    assert record['latency'] >= 0
+    assert registry.client.users == ['root']
+
+
+def test_check_instance_errors():
+    def check(url=URL, **kwargs):
+        record = check_instance(
+            url, 'root', 'admin', registry=FakeRegistry(**kwargs))
+        return record['error'], record['auth_ok'], record['tls_ok']
+
+    assert check(login_error=SSLError()) == ('invalid_ssl', False, False)
+    assert check(login_error=ConnectionError()) == ('client', False, None)
+    assert check(login_error=get_error(403)) == (
+        'invalid_password', False, True)
+    assert check(error=get_error(403)) == ('perms', True, True)
+    # the user can't be fetched, but the credentials are fine
+    assert check(error=get_error(500)) == (None, True, True)
+    assert check(error=ConnectionError()) == (None, True, True)
+    assert check(url='http://youtrack', error=get_error(403)) == (
+        'perms', True, None)
+
+
+def test_probe_keeps_health_record(cache):
+    record = probe(URL, 'root', 'admin', registry=FakeRegistry(), cache=cache)
+    assert get_health(URL + '/', 'root', 'admin', cache=cache) == record
+    assert get_health(URL, 'root', 'secret', cache=cache) is None
+
+    probe(URL, 'root', 'secret', registry=FakeRegistry(
+        login_error=get_error(403)), cache=cache)
+    key = get_health_key(URL, 'root', 'admin')
+    failed_key = get_health_key(URL, 'root', 'secret')
+    assert cache.timeouts[failed_key] < cache.timeouts[key]
+
+
+def test_warm_up(cache):
+    registry = FakeRegistry()
+    records = warm_up([(URL, 'root', 'admin'), ('https://example.com', 'bob',
+                                                'secret')],
+                      registry=registry, cache=cache)
+    assert [record['url'] for record in records] == [
+        URL, 'https://example.com']
+    assert registry.urls == [URL, 'https://example.com']
+    assert len(cache.data) == 2
+
+
+@pytest.mark.parametrize('cached_error, probes', [(None, 0), ('perms', 1)])
+def test_configuration_checks_failures_again(monkeypatch, cached_error,
+                                             probes):
+    from sentry_youtrack import configuration
+    registry = FakeRegistry()
+    checked = []
+
+    def probe(**kwargs):
+        checked.append(kwargs['url'])
+        return {'error': None}
+
+    monkeypatch.setattr(configuration, 'get_health',
+                        lambda *args: {'error': cached_error})
+    monkeypatch.setattr(configuration, 'probe', probe)
+    monkeypatch.setattr(configuration, 'get_registry', lambda: registry)
+    config = configuration.YouTrackConfiguration({})
+    client = config.get_youtrack_client(
+        {'url': URL, 'username': 'root', 'password': 'admin'})
+    assert client is registry.client
+    assert config.health == {'error': None}
+    assert not config.client_errors
+    assert len(checked) == probes
@@ -0,0 +1,84 @@
+import threading
+import time
+
+import pytest
+
+from sentry_youtrack.idempotency import (
+    IdempotencyError, IdempotentCall, get_idempotency_key)
+
+
+class CreateIssue(object):
+
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        return 'myproject-%s' % self.calls
+
+
+def test_idempotency_key():
+    assert get_idempotency_key(1, 'abc') == get_idempotency_key(1, 'abc')
+    assert get_idempotency_key(1, 'abc') != get_idempotency_key(2, 'abc')
+
+
+def test_repeated_calls_return_first_result(cache):
+    create_issue = CreateIssue()
+    assert IdempotentCall('key', cache)(create_issue) == ('myproject-1', True)
+    assert IdempotentCall('key', cache)(create_issue) == ('myproject-1', False)
+    assert IdempotentCall('other', cache)(create_issue) == (
+        'myproject-2', True)
+    assert create_issue.calls == 2
+
+
+def test_result_is_restored_from_store(cache):
+    stored = {}
+    create_issue = CreateIssue()
+    call = IdempotentCall('key', cache, lookup=lambda: stored.get('key'),
+                          save=lambda result: stored.update(key=result))
+    call(create_issue)
+    assert stored == {'key': 'myproject-1'}
+
+    # e.g. after the cache was flushed
+    cache.data.clear()
+    call = IdempotentCall('key', cache, lookup=lambda: stored.get('key'))
+    assert call(create_issue) == ('myproject-1', False)
+    assert create_issue.calls == 1
+
+
+def test_concurrent_calls_wait_for_result(cache):
+    create_issue = CreateIssue(delay=0.05)
+    results = []
+
+    def submit():
+        call = IdempotentCall('key', cache, poll_interval=0.01)
+        results.append(call(create_issue))
+
+    threads = [threading.Thread(target=submit) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert create_issue.calls == 1
+    assert sorted(results) == [('myproject-1', False)] * 3 + [
+        ('myproject-1', True)]
+
+
+def test_failed_call_can_be_retried(cache):
+
+    def fail():
+        raise ValueError()
+
+    with pytest.raises(ValueError):
+        IdempotentCall('key', cache)(fail)
+    assert IdempotentCall('key', cache)(CreateIssue()) == ('myproject-1', True)
+
+
+def test_waiting_for_running_call_times_out(cache):
+    call = IdempotentCall('key', cache, wait_timeout=0.05, poll_interval=0.01)
+    cache.add(call.lock_key, 1)
+    with pytest.raises(IdempotencyError):
+        call(CreateIssue())
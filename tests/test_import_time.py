@@ -0,0 +1,111 @@
+import os
+import re
+import subprocess
+import sys
+
+import pytest
+
+
+pytestmark = pytest.mark.skipif(
+    sys.version_info < (3, 7), reason="-X importtime requires Python 3.7")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# modules which may only be loaded on the first YouTrack interaction
+LAZY_MODULES = [
+    'aiohttp', 'bs4', 'lxml', 'requests', 'sentry_youtrack.configuration',
+    'sentry_youtrack.forms', 'sentry_youtrack.youtrack']
+
+# import time (in microseconds) of the plugin's own modules, measured after
+# Sentry and Django are loaded
+IMPORT_TIME_THRESHOLD = 50000
+
+# what Sentry has already loaded when the plugin entry point is imported
+SENTRY_MODULES = [
+    'sentry.exceptions', 'sentry.integrations', 'sentry.models',
+    'sentry.plugins.bases.issue', 'sentry.utils.cache', 'sentry_plugins.base']
+
+IMPORT_TIME_RE = re.compile(
+    r'^import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)$')
+
+SCRIPT = """
+import os, sys
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'test_settings')
+if %(stubs)r:
+    sys.path.insert(0, %(root)r)
+    from tests.fakes import install_sentry_stubs
+    install_sentry_stubs()
+try:
+    for name in %(preload)r:
+        __import__(name)
+except Exception:
+    sys.exit(3)
+sys.stderr.write('-- preloaded\\n')
+import %(module)s
+"""
+
+
+def get_import_times(module, preload=(), stubs=False):
+    """
+    Imports `module` in a new interpreter with ``-X importtime`` and returns
+    the cumulative import times of the modules loaded after `preload`, and
+    the total import time of `module`. With `stubs`, the Sentry modules are
+    replaced by the test doubles from `tests.fakes`.
+    """
+    process = subprocess.Popen(
+        [sys.executable, '-X', 'importtime', '-c',
+         SCRIPT % {'module': module, 'preload': list(preload),
+                   'stubs': stubs, 'root': ROOT}],
+        cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        universal_newlines=True)
+    _, output = process.communicate()
+    if process.returncode == 3:
+        pytest.skip("Unable to import %s" % ', '.join(preload))
+    assert process.returncode == 0, output
+
+    times = {}
+    total = 0
+    level = None
+    lines = output.split('-- preloaded\n', 1)[1].splitlines()
+    for line in lines:
+        match = IMPORT_TIME_RE.match(line)
+        if match:
+            cumulative, indent, name = match.group(2, 3, 4)
+            times[name] = int(cumulative)
+            # modules are listed after their imports, so the ones imported
+            # directly by the script have the smallest indentation
+            if level is None or len(indent) < level:
+                level, total = len(indent), 0
+            if len(indent) == level:
+                total += int(cumulative)
+    return times, total
+
+
+def get_lazy_modules(times):
+    return sorted(name for name in times for module in LAZY_MODULES
+                  if name == module or name.startswith(module + '.'))
+
+
+def test_plugin_import_time():
+    times, total = get_import_times('sentry_youtrack.plugin', SENTRY_MODULES)
+    assert get_lazy_modules(times) == []
+    assert total < IMPORT_TIME_THRESHOLD
+
+
+def test_plugin_does_not_import_lazy_modules():
+    # runs without Sentry, unlike the timing above
+    times, _ = get_import_times('sentry_youtrack.plugin', stubs=True)
+    assert 'sentry_youtrack.plugin' in times
+    assert get_lazy_modules(times) == []
+
+
+def test_registry_import_time():
+    times, total = get_import_times(
+        'sentry_youtrack.registry', ['django.conf', 'django.utils.encoding'])
+    assert get_lazy_modules(times) == []
+    assert total < IMPORT_TIME_THRESHOLD
+
+
+def test_forms_do_not_import_client():
+    times, _ = get_import_times('sentry_youtrack.forms', ['django.forms'])
+    assert get_lazy_modules(times) == ['sentry_youtrack.forms']
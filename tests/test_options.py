@@ -0,0 +1,79 @@
+from sentry_youtrack.options import OptionsSnapshot
+
+
+class Project(object):
+
+    def __init__(self, id):
+        self.id = id
+
+
+class OptionsLoader(object):
+    """Fake ProjectOption storage, every call stands for one DB query."""
+
+    def __init__(self, options):
+        self.options = options
+        self.queries = 0
+
+    def __call__(self, project):
+        self.queries += 1
+        return dict(self.options[project.id])
+
+
+OPTIONS = {
+    1: {'youtrack:url': 'https://youtrack.myjetbrains.com',
+        'youtrack:username': 'root',
+        'youtrack:password': 'admin',
+        'youtrack:project': 'myproject',
+        'mail:subject_prefix': '[Sentry]'},
+    2: {'youtrack:project': 'testproject'}}
+
+
+def test_options_are_loaded_once_per_request():
+    loader = OptionsLoader(OPTIONS)
+    snapshot = OptionsSnapshot('youtrack:', loader)
+    project = Project(1)
+    with snapshot.activate():
+        for key in ['url', 'username', 'password', 'project',
+                    'ignore_fields', 'default_tags', 'default_fields']:
+            snapshot.get(project, key)
+        assert snapshot.get(project, 'project') == 'myproject'
+        assert snapshot.get(project, 'default_tags') is None
+        assert snapshot.get(Project(2), 'project') == 'testproject'
+    assert loader.queries == 2
+
+
+def test_snapshot_keeps_only_plugin_options():
+    snapshot = OptionsSnapshot('youtrack:', OptionsLoader(OPTIONS))
+    with snapshot.activate():
+        values = snapshot.get_values(Project(1))
+    assert 'mail:subject_prefix' not in values
+    assert len(values) == 4
+
+
+def test_snapshot_is_request_scoped():
+    loader = OptionsLoader(OPTIONS)
+    snapshot = OptionsSnapshot('youtrack:', loader)
+    project = Project(1)
+    assert not snapshot.is_active()
+    with snapshot.activate():
+        with snapshot.activate():
+            snapshot.get(project, 'url')
+        assert snapshot.is_active()
+        snapshot.get(project, 'url')
+    assert not snapshot.is_active()
+    with snapshot.activate():
+        snapshot.get(project, 'url')
+    assert loader.queries == 2
+
+
+def test_invalidate_reloads_options():
+    loader = OptionsLoader(OPTIONS)
+    snapshot = OptionsSnapshot('youtrack:', loader)
+    project = Project(1)
+    with snapshot.activate():
+        assert snapshot.get(project, 'project') == 'myproject'
+        loader.options = {1: {'youtrack:project': 'testproject'}}
+        snapshot.invalidate(project)
+        assert snapshot.get(project, 'project') == 'testproject'
+    assert loader.queries == 2
+    snapshot.invalidate(project)
@@ -0,0 +1,232 @@
+import pytest
+
+
+class Project(object):
+
+    def __init__(self, id):
+        self.id = id
+
+
+class Group(object):
+
+    def __init__(self, id, project):
+        self.id = id
+        self.project = project
+
+
+class User(object):
+    is_staff = False
+
+
+class Request(object):
+
+    def __init__(self, GET=None, POST=None):
+        self.GET = GET or {}
+        self.POST = POST or {}
+        self.user = User()
+
+
+class OptionsStorage(object):
+    """Fake ProjectOption storage, every load stands for one DB query."""
+
+    def __init__(self, options):
+        self.options = options
+        self.queries = 0
+
+    def load(self, project):
+        self.queries += 1
+        return dict(self.options.get(project.id, {}))
+
+    def get_option(self, key, project=None, user=None):
+        return self.options.get(project.id, {}).get('youtrack:%s' % key)
+
+    def set_option(self, key, value, project=None, user=None):
+        self.options.setdefault(project.id, {})['youtrack:%s' % key] = value
+
+
+OPTIONS = {
+    1: {'youtrack:url': 'https://youtrack.myjetbrains.com',
+        'youtrack:username': 'root',
+        'youtrack:password': 'admin',
+        'youtrack:project': 'myproject'}}
+
+
+def get_plugin(plugin_module, monkeypatch, storage):
+    plugin = plugin_module.YouTrackPlugin()
+    monkeypatch.setattr(plugin.options_snapshot, 'loader', storage.load)
+    monkeypatch.setattr(
+        plugin_module.IssuePlugin, 'get_option', storage.get_option)
+    monkeypatch.setattr(
+        plugin_module.IssuePlugin, 'set_option', storage.set_option)
+    return plugin
+
+
+def test_options_are_loaded_once_per_view(plugin_module, monkeypatch):
+    storage = OptionsStorage(OPTIONS)
+    plugin = get_plugin(plugin_module, monkeypatch, storage)
+    group = Group(1, Project(1))
+    results = []
+
+    def view(self, request, group, **kwargs):
+        project = group.project
+        results.append(self.get_youtrack_client_settings(project))
+        for key in ['project', 'ignore_fields', 'default_tags']:
+            self.get_option(key, project)
+        self.set_option('default_tags', 'sentry', project)
+        results.append(self.get_option('default_tags', project))
+        results.append(self.get_option('default_tags', project))
+
+    monkeypatch.setattr(plugin_module.IssuePlugin, 'view', view)
+    plugin.view(Request(), group)
+
+    settings, default_tags, _ = results
+    assert settings['url'] == 'https://youtrack.myjetbrains.com'
+    assert settings['username'] == 'root'
+    assert default_tags == 'sentry'
+    # one load, and one more after set_option invalidated the snapshot
+    assert storage.queries == 2
+
+
+def test_options_outside_view_are_not_snapshotted(plugin_module, monkeypatch):
+    storage = OptionsStorage(OPTIONS)
+    plugin = get_plugin(plugin_module, monkeypatch, storage)
+    assert plugin.get_option('project', Project(1)) == 'myproject'
+    assert storage.queries == 0
+
+
+class GroupMetaManager(object):
+    """Fake GroupMeta manager, `populate_cache` stands for the one query."""
+
+    def __init__(self, values):
+        self.values = values
+        self.cache = {}
+        self.populated = []
+
+    def populate_cache(self, instance_list):
+        self.populated.append([group.id for group in instance_list])
+        for group in instance_list:
+            self.cache[group.id] = self.values.get(group.id, {})
+
+    def get_value(self, instance, key, default=None):
+        # values are only served from the populated cache
+        return self.cache[instance.id].get(key, default)
+
+    def set_value(self, instance, key, value):
+        self.values.setdefault(instance.id, {})[key] = value
+        self.cache.setdefault(instance.id, {})[key] = value
+
+
+def set_group_meta(plugin_module, monkeypatch, values):
+    objects = GroupMetaManager(values)
+    monkeypatch.setattr(plugin_module.GroupMeta, 'objects', objects)
+    return objects
+
+
+def test_get_issue_ids(plugin_module, monkeypatch):
+    objects = set_group_meta(plugin_module, monkeypatch, {
+        1: {'youtrack:tid': 'myproject-1'},
+        3: {'youtrack:tid': 'myproject-3', 'youtrack:idempotency': 'key'}})
+    plugin = plugin_module.YouTrackPlugin()
+    project = Project(1)
+    groups = [Group(group_id, project) for group_id in [1, 2, 3]]
+
+    assert plugin.get_issue_ids(groups) == {
+        1: 'myproject-1', 3: 'myproject-3'}
+    assert objects.populated == [[1, 2, 3]]
+    assert plugin.get_issue_ids([]) == {}
+
+
+class Event(object):
+
+    def __init__(self, data):
+        self.data = data
+
+
+def test_suggested_issue(plugin_module, monkeypatch, cache):
+    monkeypatch.setattr(plugin_module, 'cache', cache)
+    storage = OptionsStorage(OPTIONS)
+    plugin = get_plugin(plugin_module, monkeypatch, storage)
+    event = Event({'exception': {'values': [
+        {'type': 'ValueError', 'stacktrace': {'frames': [
+            {'module': 'app.views', 'function': 'index', 'in_app': True}]}}]}})
+    other_event = Event({'exception': {'values': [{'type': 'KeyError'}]}})
+
+    plugin.add_to_fingerprint_index(Project(1), event, 'myproject-1')
+    plugin.add_to_fingerprint_index(Project(1), other_event, 'myproject-2')
+
+    assert plugin.get_suggested_issue(Project(1), event) == 'myproject-1'
+    assert plugin.get_suggested_issue(Project(1), other_event) == 'myproject-2'
+    assert plugin.get_suggested_issue(Project(2), event) is None
+    assert plugin.get_suggested_issue(Project(1), None) is None
+    # links are kept apart from the project options
+    assert storage.options == OPTIONS
+    assert set(cache.timeouts.values()) == {plugin_module.FINGERPRINT_TIMEOUT}
+
+
+class ProjectFieldsForm(object):
+
+    def __init__(self, project_fields, data):
+        self.data = data
+
+    def get_project_field_values(self):
+        return {'Priority': self.data.get('Priority')}
+
+
+class YouTrackClient(object):
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.issues = []
+        self.commands = []
+        self.tags = []
+
+    def create_issue(self, data, key=None):
+        self.issues.append((data, key))
+        return 'myproject-%s' % len(self.issues)
+
+    def execute_command(self, issue_id, command):
+        if self.failures:
+            self.failures -= 1
+            raise ValueError()
+        self.commands.append((issue_id, command))
+
+    def add_tags(self, issue_id, tags):
+        self.tags.append((issue_id, tags))
+
+
+class IssueGroup(Group):
+
+    def get_latest_event(self):
+        return None
+
+
+def test_issue_form_submitted_twice(plugin_module, monkeypatch, cache):
+    monkeypatch.setattr(plugin_module, 'cache', cache)
+    objects = set_group_meta(plugin_module, monkeypatch, {})
+    plugin = get_plugin(plugin_module, monkeypatch, OptionsStorage(OPTIONS))
+    client = YouTrackClient(failures=1)
+    monkeypatch.setattr(
+        plugin_module.YouTrackPlugin, 'project_fields_form', ProjectFieldsForm)
+    monkeypatch.setattr(plugin, 'get_project_fields', lambda project: [])
+    monkeypatch.setattr(plugin, 'get_youtrack_client', lambda project: client)
+    group = IssueGroup(1, Project(1))
+    objects.populate_cache([group])
+    request = Request(POST={'Priority': 'Major'})
+    form_data = {'title': 'Error', 'description': 'Traceback', 'tags': 'sentry',
+                 'idempotency_key': 'abc'}
+
+    # the issue is created, but setting its fields fails
+    with pytest.raises(ValueError):
+        plugin.create_issue(request, group, form_data)
+    assert plugin.create_issue(request, group, form_data) == 'myproject-1'
+    assert plugin.create_issue(request, group, form_data) == 'myproject-1'
+    assert len(client.issues) == 1
+    # the key is kept in the issue, to be found after a lost request
+    data, key = client.issues[0]
+    assert key and data['description'] == 'Traceback' + (
+        plugin_module.ISSUE_KEY_LINE % key)
+    assert client.commands[0] == ('myproject-1', 'Priority Major')
+    assert client.tags[0] == ('myproject-1', ['sentry'])
+
+    form_data = dict(form_data, idempotency_key='def')
+    assert plugin.create_issue(request, group, form_data) == 'myproject-2'
@@ -0,0 +1,99 @@
+import json
+import os
+import time
+
+from vcr import VCR
+
+from sentry_youtrack.profiling import get_trace, trace
+from sentry_youtrack.youtrack import YouTrackClient
+
+
+vcr = VCR(path_transformer=VCR.ensure_suffix('.yaml'),
+          cassette_library_dir=os.path.join('tests', 'cassettes'))
+
+
+def get_client(**kwargs):
+    return YouTrackClient('https://youtrack.myjetbrains.com',
+                          api_key='abcd1234', **kwargs)
+
+
+class SlowLimiter(object):
+
+    def __enter__(self):
+        time.sleep(0.05)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+@vcr.use_cassette('test_get_projects.yaml')
+def test_trace_records_requests():
+    with trace() as call_trace:
+        assert get_trace() is call_trace
+        projects = list(get_client().get_projects())
+    assert get_trace() is None
+    assert len(projects) == 2
+
+    assert len(call_trace.calls) == 1
+    call = call_trace.calls[0]
+    assert call['kind'] == 'request'
+    assert call['method'] == 'GET'
+    assert call['url'] == 'https://youtrack.myjetbrains.com/rest/project/all'
+    assert call['status'] == 200
+    assert call['bytes'] > 0
+    assert call['offset'] >= 0
+    assert call['duration'] >= 0
+    assert call['parse_time'] > 0
+
+
+@vcr.use_cassette('test_get_project_name.yaml')
+def test_trace_waterfall():
+    with trace() as call_trace:
+        call_trace.record_cache('cached_fields', False)
+        get_client().get_project_name('myproject')
+
+    rows = list(call_trace.rows())
+    assert [row['kind'] for row in rows] == ['cache', 'request']
+    assert rows[0]['status'] == 'miss'
+    assert all(0 <= row['left'] <= 100 for row in rows)
+    assert all(0 < row['width'] <= 100 for row in rows)
+
+    data = json.loads(call_trace.to_json())
+    assert len(data['calls']) == 2
+    assert data['total'] >= 0
+
+
+@vcr.use_cassette('test_get_projects.yaml')
+def test_disabled_trace():
+    with trace(enabled=False) as call_trace:
+        list(get_client().get_projects())
+    assert call_trace is None
+    assert get_trace() is None
+
+
+@vcr.use_cassette('test_get_projects.yaml')
+def test_trace_records_queue_time_separately():
+    with trace() as call_trace:
+        list(get_client(limiter=SlowLimiter()).get_projects())
+    call = call_trace.calls[0]
+    assert call['queued'] >= 0.05
+    assert call['duration'] < call['queued']
+    assert call_trace.total >= call['queued'] + call['duration']
+
+    row = next(call_trace.rows())
+    assert row['queue_ms'] >= 50
+    assert abs(row['left'] - row['queue_left'] - row['queue_width']) < 0.02
+
+
+def test_trace_json_is_truncated():
+    with trace() as call_trace:
+        for index in range(50):
+            url = 'https://youtrack.myjetbrains.com/rest/issue/%s' % index
+            call_trace.record_request('get', url, time.time(), 0.01, 100, 200)
+    assert len(json.loads(call_trace.to_json())['calls']) == 50
+
+    result = call_trace.to_json(max_bytes=4096)
+    assert len(result) <= 4096
+    data = json.loads(result)
+    assert data['truncated'] == 50 - len(data['calls'])
+    assert data['calls'][0]['url'].endswith('/0')
@@ -0,0 +1,179 @@
+import threading
+import time
+from functools import partial
+
+import pytest
+from requests import HTTPError
+
+from sentry_youtrack.registry import CacheSemaphore, ClientRegistry
+from sentry_youtrack.scheduler import (
+    BACKGROUND, INTERACTIVE, RequestScheduler)
+from sentry_youtrack.youtrack import YouTrackClient
+
+
+URL = 'https://youtrack.myjetbrains.com'
+
+
+class FakeClient(object):
+
+    def __init__(self, url, **kwargs):
+        self.url = url
+        self.limiter = kwargs['limiter']
+
+
+def get_registry(**kwargs):
+    registry = ClientRegistry(report=None, **kwargs)
+    registry.client_class = FakeClient
+    return registry
+
+
+def test_registry_reuses_clients():
+    registry = get_registry()
+    client = registry.get_client(URL, 'root', 'admin')
+    assert registry.get_client(URL + '/', 'root', 'admin') is client
+    assert registry.get_client(URL, 'root', 'secret') is not client
+
+
+def test_registry_expires_clients():
+    registry = get_registry(ttl=0)
+    client = registry.get_client(URL, 'root', 'admin')
+    assert registry.get_client(URL, 'root', 'admin') is not client
+
+
+class Response(object):
+
+    def __init__(self, status_code, text='', cookies=None):
+        self.status_code = status_code
+        self.text = text
+        self.content = text.encode('utf-8')
+        self.cookies = cookies or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise HTTPError(response=self)
+
+
+class ExpiringSession(object):
+    """Fake YouTrack which can forget the sessions it handed out."""
+
+    cookie_name = YouTrackClient.API_KEY_COOKIE_NAME
+
+    def __init__(self):
+        self.logins = 0
+        self.api_key = None
+        self.rejected = False
+
+    def post(self, **kwargs):
+        self.logins += 1
+        self.api_key = 'key%s' % self.logins
+        return Response(200, '<login>ok</login>',
+                        {self.cookie_name: self.api_key})
+
+    def get(self, **kwargs):
+        if self.rejected or kwargs['cookies'][
+                self.cookie_name] != self.api_key:
+            return Response(401)
+        return Response(200, '<project name="My project"/>')
+
+
+def test_client_logs_in_again_after_session_expired():
+    session = ExpiringSession()
+    registry = get_registry()
+    registry.client_class = partial(YouTrackClient, session=session)
+    client = registry.get_client(URL, 'root', 'admin')
+
+    # e.g. YouTrack was restarted
+    session.api_key = None
+    assert client.get_project_name('myproject') == 'My project'
+    assert session.logins == 2
+    new_client = registry.get_client(URL, 'root', 'admin')
+    assert new_client is not client
+    assert client.api_key == new_client.api_key == 'key2'
+
+    # the login is renewed once per request
+    session.rejected = True
+    with pytest.raises(HTTPError) as excinfo:
+        new_client.get_project_name('myproject')
+    assert excinfo.value.response.status_code == 401
+    assert session.logins == 3
+
+
+def test_client_without_registry_logs_in_again():
+    session = ExpiringSession()
+    client = YouTrackClient(URL, username='root', password='admin',
+                            session=session)
+    session.api_key = None
+    assert client.get_project_name('myproject') == 'My project'
+    assert client.api_key == 'key2'
+
+
+def test_clients_share_instance_scheduler():
+    registry = get_registry()
+    client = registry.get_client(URL, 'root', 'admin')
+    other_client = registry.get_client(URL, 'bob', 'admin')
+    assert client.limiter is other_client.limiter
+    assert registry.get_client(
+        'https://example.com', 'root', 'admin').limiter is not client.limiter
+
+
+def run_concurrently(scheduler, workers=6):
+    state = {'running': 0, 'max_running': 0}
+    lock = threading.Lock()
+
+    def worker():
+        with scheduler:
+            with lock:
+                state['running'] += 1
+                state['max_running'] = max(
+                    state['max_running'], state['running'])
+            time.sleep(0.02)
+            with lock:
+                state['running'] -= 1
+
+    threads = [threading.Thread(target=worker) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return state['max_running']
+
+
+def test_scheduler_bounds_in_flight_requests():
+    waits = []
+    scheduler = RequestScheduler(
+        URL, 2, report=lambda instance, name, wait, depth: waits.append(wait))
+    assert run_concurrently(scheduler) == 2
+    assert len(waits) == 6
+    assert max(waits) > 0
+
+
+def test_scheduler_with_shared_semaphore(cache):
+    shared_semaphore = CacheSemaphore(
+        'youtrack:inflight', 2, cache=cache, poll_interval=0.001)
+    scheduler = RequestScheduler(
+        URL, 4, shared_semaphore=shared_semaphore, report=None)
+    assert run_concurrently(scheduler) == 2
+    assert not cache.data
+
+
+def test_shared_semaphore_keeps_slot_for_interactive_requests(cache):
+    semaphore = CacheSemaphore(
+        'youtrack:inflight', 2, cache=cache, poll_interval=0.001)
+    semaphore.acquire(BACKGROUND)
+
+    def start(priority_value):
+        thread = threading.Thread(
+            target=semaphore.acquire, args=(priority_value,))
+        thread.daemon = True
+        thread.start()
+        thread.join(0.05)
+        return thread
+
+    background = start(BACKGROUND)
+    assert background.is_alive()
+    interactive = start(INTERACTIVE)
+    assert not interactive.is_alive()
+
+    semaphore.release()
+    background.join(1)
+    assert not background.is_alive()
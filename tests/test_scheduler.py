@@ -0,0 +1,73 @@
+import threading
+import time
+
+from sentry_youtrack.scheduler import (
+    BACKGROUND, INTERACTIVE, RequestScheduler, TokenBucket, get_priority,
+    priority)
+
+
+URL = 'https://youtrack.myjetbrains.com'
+
+
+def test_priority_context():
+    assert get_priority() == INTERACTIVE
+    with priority(BACKGROUND):
+        assert get_priority() == BACKGROUND
+    assert get_priority() == INTERACTIVE
+
+
+def test_token_bucket():
+    now = time.time()
+    bucket = TokenBucket(rate=10, burst=2)
+    bucket.consume(now)
+    bucket.consume(now)
+    assert bucket.get_delay(now) > 0
+    assert bucket.get_delay(now + 0.2) == 0
+
+
+def test_interactive_requests_jump_ahead_of_background_work():
+    scheduler = RequestScheduler(URL, 1, report=None)
+    order = []
+    scheduler.acquire()
+
+    def worker(name, priority_value):
+        scheduler.acquire(priority_value)
+        order.append(name)
+        scheduler.release()
+
+    threads = []
+    for name, priority_value in [('background-1', BACKGROUND),
+                                 ('background-2', BACKGROUND),
+                                 ('interactive', INTERACTIVE)]:
+        thread = threading.Thread(target=worker, args=(name, priority_value))
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.02)
+
+    assert scheduler.stats()['background']['queued'] == 2
+    assert scheduler.stats()['interactive']['queued'] == 1
+    scheduler.release()
+    for thread in threads:
+        thread.join()
+    assert order == ['interactive', 'background-1', 'background-2']
+
+    stats = scheduler.stats()
+    assert stats['running'] == 0
+    assert stats['background']['requests'] == 2
+    assert stats['background']['avg_wait'] > 0
+
+
+def test_rate_limit():
+    scheduler = RequestScheduler(URL, 10, rate=50, burst=1, report=None)
+    start = time.time()
+    for _ in range(3):
+        with scheduler:
+            pass
+    assert time.time() - start >= 0.035
+
+
+def test_pause():
+    scheduler = RequestScheduler(URL, 10, report=None)
+    scheduler.pause(0.05)
+    assert scheduler.acquire() >= 0.04
+    scheduler.release()
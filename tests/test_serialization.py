@@ -0,0 +1,64 @@
+from sentry_youtrack.serialization import (
+    HEADER, MAGIC, ProjectField, pack_project_fields, unpack_project_fields)
+
+
+PROJECT_FIELDS = [
+    {'name': 'Assignee',
+     'values': ['root', 'john', 'bob'],
+     'empty_text': 'Unassigned',
+     'type': 'user[1]'},
+    {'name': 'Reviewer',
+     'values': ['root', 'john', 'bob'],
+     'empty_text': 'Unassigned',
+     'type': 'user[1]'},
+    {'name': 'Fix versions',
+     'values': [],
+     'empty_text': 'Unscheduled',
+     'type': 'version[*]'},
+    {'name': 'Estimation',
+     'values': None,
+     'empty_text': None,
+     'type': 'integer'}]
+
+
+def test_pack_and_unpack_project_fields():
+    for codec in [None, 'zlib']:
+        fields = unpack_project_fields(
+            pack_project_fields(PROJECT_FIELDS, codec=codec))
+        assert len(fields) == len(PROJECT_FIELDS)
+        assert list(fields) == PROJECT_FIELDS
+        assert [field.as_dict() for field in fields] == PROJECT_FIELDS
+
+
+def test_unpacked_fields_support_item_access():
+    fields = unpack_project_fields(pack_project_fields(PROJECT_FIELDS))
+    field = fields[0]
+    assert isinstance(field, ProjectField)
+    assert field['name'] == field.name == 'Assignee'
+    assert field['type'] == 'user[1]'
+    assert field['values'] == ['root', 'john', 'bob']
+    assert fields[-1]['values'] is None
+
+
+def test_values_are_decoded_lazily():
+    fields = unpack_project_fields(pack_project_fields(PROJECT_FIELDS))
+    field = fields[0]
+    assert field._load_values is not None
+    assert field.values == ['root', 'john', 'bob']
+    assert field._load_values is None
+
+
+def test_duplicated_value_lists_are_stored_once():
+    users = ['user%s' % index for index in range(100)]
+    fields = [dict(field, values=users) for field in PROJECT_FIELDS[:2]]
+    single = len(pack_project_fields(fields[:1], codec=None))
+    double = len(pack_project_fields(fields, codec=None))
+    assert double - single < 50
+
+
+def test_incompatible_payload_is_ignored():
+    data = pack_project_fields(PROJECT_FIELDS)
+    newer = HEADER.pack(MAGIC, 99, 0) + data[HEADER.size:]
+    assert unpack_project_fields(newer) is None
+    assert unpack_project_fields(b'') is None
+    assert unpack_project_fields(PROJECT_FIELDS) is None
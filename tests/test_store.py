@@ -0,0 +1,34 @@
+import os
+
+from sentry_youtrack.store import MetadataStore
+
+
+def test_get_and_set(tmpdir):
+    store = MetadataStore(str(tmpdir.join('metadata')))
+    assert store.get('fields') is None
+    store.set('fields', b'payload')
+    assert store.get('fields') == b'payload'
+    store.set('fields', b'new payload')
+    assert store.get('fields') == b'new payload'
+
+
+def test_set_leaves_no_temporary_files(tmpdir):
+    store = MetadataStore(str(tmpdir))
+    store.set('fields', b'payload')
+    assert os.listdir(str(tmpdir)) == ['fields%s' % store.suffix]
+
+
+def test_delete(tmpdir):
+    store = MetadataStore(str(tmpdir))
+    store.set('fields', b'payload')
+    store.delete('fields')
+    store.delete('fields')
+    assert store.get('fields') is None
+
+
+def test_unwritable_store_is_ignored(tmpdir):
+    path = tmpdir.join('file')
+    path.write('')
+    store = MetadataStore(str(path))
+    store.set('fields', b'payload')
+    assert store.get('fields') is None
@@ -0,0 +1,85 @@
+import threading
+import time
+
+from sentry_youtrack.serialization import (
+    pack_project_fields, unpack_project_fields)
+from sentry_youtrack.store import MetadataStore
+
+
+def get_fields(version):
+    return [{'name': 'Priority', 'values': ['Major', version],
+             'empty_text': 'No priority', 'type': 'enum[1]'}]
+
+
+def get_cached_value(cache):
+    values = [value for key, value in cache.data.items()
+              if not key.endswith(':refresh')]
+    assert len(values) == 1
+    return values[0]
+
+
+def wait_for_refresh(cache, timeout=5):
+    deadline = time.time() + timeout
+    while any(key.endswith(':refresh') for key in cache.data):
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
+def test_stored_value_is_served_on_cache_miss(utils_module, monkeypatch,
+                                              cache, tmpdir):
+    monkeypatch.setattr(utils_module, 'cache', cache)
+    refreshing = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    @utils_module.cache_this(600, dumps=pack_project_fields,
+                             loads=unpack_project_fields,
+                             store=MetadataStore(str(tmpdir)))
+    def get_project_fields(project_id):
+        calls.append(project_id)
+        if len(calls) > 1:
+            refreshing.set()
+            release.wait(5)
+        return get_fields('v%s' % len(calls))
+
+    assert list(get_project_fields('myproject')) == get_fields('v1')
+    # e.g. the cache was flushed
+    cache.data.clear()
+
+    # the refresh is still blocked, so the stored value wasn't fetched now
+    assert list(get_project_fields('myproject')) == get_fields('v1')
+    assert refreshing.wait(5)
+    assert any(key.endswith(':refresh') for key in cache.data)
+    assert list(get_project_fields('myproject')) == get_fields('v1')
+    assert calls == ['myproject', 'myproject']
+
+    release.set()
+    wait_for_refresh(cache)
+    assert list(unpack_project_fields(get_cached_value(cache))) == get_fields(
+        'v2')
+    assert list(get_project_fields('myproject')) == get_fields('v2')
+    assert len(calls) == 2
+
+
+def test_old_cache_entry_is_fetched_again(utils_module, monkeypatch, cache):
+    monkeypatch.setattr(utils_module, 'cache', cache)
+    calls = []
+
+    @utils_module.cache_this(600, dumps=pack_project_fields,
+                             loads=unpack_project_fields)
+    def get_project_fields(project_id):
+        calls.append(project_id)
+        return get_fields('v%s' % len(calls))
+
+    assert list(get_project_fields('myproject')) == get_fields('v1')
+    assert list(get_project_fields('myproject')) == get_fields('v1')
+    assert len(calls) == 1
+    assert isinstance(get_cached_value(cache), bytes)
+
+    # the list of dicts cached before the packed format
+    key, = cache.data
+    cache.set(key, get_fields('v0'), 600)
+    assert list(get_project_fields('myproject')) == get_fields('v2')
+    assert len(calls) == 2
+    assert list(unpack_project_fields(get_cached_value(cache))) == get_fields(
+        'v2')